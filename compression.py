@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# HARDCHATS WebRTC Voice/Video Server - Developed by acidvegas (https://github.com/acidvegas/hardchats)
+# hardchats/compression.py
+
+'''
+Outbound WebSocket framing with size-aware permessage-deflate.
+
+aiohttp negotiates permessage-deflate on its own, but then runs every outgoing frame
+(even a 40 byte mic_status) through a long-lived per-connection compressor. Instead we
+take over the send side once the handshake is done:
+
+	- frames below config.WS_COMPRESS_MIN_SIZE go out uncompressed (RSV1 clear)
+	- larger frames are deflated with a fresh, small-window compressor and no context
+	  takeover, so nothing is kept per connection and the same bytes are valid for every
+	  recipient - a fan-out serializes and compresses once, then reuses the result
+
+Both are legal on a deflate connection (RFC 7692 section 6): a sender may leave any
+message uncompressed, and may always use a smaller window than negotiated (never a larger
+one, so the window is min(negotiated, config.WS_COMPRESS_WBITS) per client).
+
+aiohttp has no public API for either (compression is per connection, and there is no way
+to send an already-deflated payload), so this reaches into its WebSocket writer: `compress`,
+`_write_websocket_frame()` and `protocol._paused`. Those are only tested against the aiohttp
+range pinned in requirements.txt; anything missing falls back to public send_str().
+'''
+
+import json
+import zlib
+
+try:
+	from aiohttp import web
+except ImportError:
+	raise SystemExit('missing aiohttp library (pip install aiohttp)')
+
+import config
+
+
+DEFLATE_TRAILER = b'\x00\x00\xff\xff'
+RSV1            = 0x40
+
+
+class Frame:
+	'''A JSON message serialized once, with its deflated form computed on first use'''
+
+	__slots__ = ('text', 'size', '_deflated')
+
+	def __init__(self, message: dict):
+		self.text      = json.dumps(message)
+		self.size      = len(self.text)
+		self._deflated = {} # window bits -> payload (clients can negotiate different windows)
+
+
+	def deflated(self, wbits: int) -> bytes:
+		'''
+		Return the raw deflate payload for this frame (RFC 7692 section 7.2.1)
+
+		:param wbits: The LZ77 window size to compress with (9-15)
+		'''
+
+		if wbits not in self._deflated:
+			compressor            = zlib.compressobj(config.WS_COMPRESS_LEVEL, zlib.DEFLATED, -wbits, config.WS_COMPRESS_MEMLEVEL)
+			payload               = compressor.compress(self.text.encode('utf-8')) + compressor.flush(zlib.Z_SYNC_FLUSH)
+			self._deflated[wbits] = payload.removesuffix(DEFLATE_TRAILER)
+
+		return self._deflated[wbits]
+
+
+def claim_compression(ws: web.WebSocketResponse) -> int:
+	'''
+	Call right after ws.prepare(). Returns the window bits to deflate this client's frames with
+	(0 if it didn't negotiate permessage-deflate), and switches off aiohttp's own per-connection
+	compressor so send_frame() decides per message.
+
+	:param ws: The prepared WebSocket response
+	'''
+
+	if not ws.compress:
+		return 0
+
+	writer = getattr(ws, '_writer', None)
+	if writer is not None and hasattr(writer, 'compress'):
+		writer.compress = 0
+
+	# ws.compress is the negotiated server_max_window_bits (15 when the client didn't limit it)
+	return min(ws.compress, config.WS_COMPRESS_WBITS)
+
+
+async def send_frame(ws: web.WebSocketResponse, frame: Frame, deflate: int):
+	'''
+	Send a pre-serialized frame, compressing it only if the client negotiated deflate and the
+	frame is big enough to be worth it
+
+	:param ws: The WebSocket to send on
+	:param frame: The serialized frame
+	:param deflate: The window bits from claim_compression() (0 = send uncompressed)
+	'''
+
+	if not deflate or frame.size < config.WS_COMPRESS_MIN_SIZE:
+		return await ws.send_str(frame.text)
+
+	# Reuse the shared compressed payload when the writer exposes a raw frame write and the
+	# transport isn't applying backpressure. Otherwise let aiohttp compress this one frame
+	# with a throwaway compressor of the same window size (still no per-connection state).
+	writer   = getattr(ws, '_writer', None)
+	protocol = getattr(writer, 'protocol', None)
+
+	if hasattr(writer, '_write_websocket_frame') and not getattr(protocol, '_paused', True):
+		writer._write_websocket_frame(frame.deflated(deflate), web.WSMsgType.TEXT, RSV1)
+	else:
+		await ws.send_str(frame.text, compress=deflate)
@@ -2,6 +2,7 @@
 # HARDCHATS WebRTC Voice/Video Server - Developed by acidvegas (https://github.com/acidvegas/hardchats)
 # hardchats/config.py
 
+import importlib.util
 import os
 
 # Load environment variables if .env file exists (otherwise set by Docker -e flags)
@@ -23,6 +24,28 @@ SERVER_PORT = 58080
 MAX_USERS   = 25
 MAX_CAMERAS = 10
 
+# Lobby (clients that pass the captcha while the room is full wait in line for a free slot)
+LOBBY_MAX_WAITING = 50 # 0 turns joins away with 'Room is full' like before
+
+# Hot reload (SIGHUP always reloads; this polls config.py & .env for changes, 0 disables)
+CONFIG_WATCH_INTERVAL = 5 # seconds
+
+# WebSocket compression (permessage-deflate, only used when the browser offers it)
+WS_COMPRESSION        = True # negotiate permessage-deflate with clients
+WS_COMPRESS_MIN_SIZE  = 1024 # bytes, smaller frames are sent uncompressed
+WS_COMPRESS_LEVEL     = 1    # zlib level, 1 = fastest (signaling JSON compresses well anyway)
+WS_COMPRESS_WBITS     = 12   # 4KB window (9-15), bounds compressor memory per message
+WS_COMPRESS_MEMLEVEL  = 5    # zlib memLevel (1-9), lower = less memory per message
+
+# Presence coalescing (joins, leaves & status flags inside this window go out as one presence_delta per client)
+PRESENCE_COALESCE_MS = 40 # milliseconds, 0 sends every change right away
+
+# Occupancy feed (/api/users/stream pushes the joined count to the login screen instead of polling)
+OCCUPANCY_PUSH_MIN_MS = 1000  # milliseconds to coalesce joins/leaves before pushing
+OCCUPANCY_PUSH_MAX_MS = 10000 # milliseconds, backoff ceiling while the count keeps changing
+OCCUPANCY_MAX_FEEDS   = 2000  # open feeds past this get a 503 (clients fall back to polling)
+OCCUPANCY_KEEPALIVE   = 30    # seconds between keepalive comments on idle feeds
+
 # TURN/STUN settings
 STUN_SERVER = f'stun:{os.getenv('TURN_SERVER')}:{os.getenv('TURN_PORT')}'
 TURN_SERVER = {
@@ -34,6 +57,19 @@ TURN_SERVER = {
 ICE_TRANSPORT_POLICY = 'relay'
 
 
+# SDP policy (rewrites offers/answers in the signaling relay, see sdp.py)
+SDP_POLICY                      = True
+SDP_OPUS_DTX                    = True  # stop sending during silence
+SDP_OPUS_FEC                    = True  # in-band forward error correction
+SDP_OPUS_MAX_BITRATE            = 48000 # bits per second
+SDP_OPUS_MAX_BITRATE_AUDIO_ONLY = 24000 # bits per second, for car mode users (matches client.js)
+SDP_CODEC_ORDER                 = {'audio': ['opus'], 'video': ['VP8', 'H264', 'VP9', 'AV1']}
+SDP_VIDEO_BUDGET_KBPS           = 3000  # total camera kbps a receiver accepts, split across cameras on
+SDP_VIDEO_MIN_KBPS              = 150   # per-stream floor no matter how many cameras are on
+SDP_VIDEO_MAX_KBPS              = 1500  # per-stream ceiling
+SDP_VIDEO_AUDIO_ONLY_KBPS       = 30    # car mode users get (almost) no video
+
+
 # IRC settings
 IRC_SERVER          = f'wss://{os.getenv('IRC_SERVER')}:{os.getenv('IRC_PORT')}'
 IRC_CHANNEL         = os.getenv('IRC_CHANNEL')
@@ -46,6 +82,23 @@ IRC_JOIN_DELAY      = 6000  # milliseconds (delay before joining channel)
 IRC_MAX_BACKLOG     = 5000  # max messages to keep in chat history
 
 
+# Profiling settings (toggle with SIGUSR1 or the local-only /api/debug/profile endpoint)
+PROFILE_DIR       = 'profiles' # where SIGUSR1 writes the trace/flamegraph files on stop
+PROFILE_MAX_SPANS = 200000     # oldest spans are dropped past this
+
+# Signaling recorder (redacted traffic logs for helpers/replay.py, also toggled by SIGUSR2)
+RECORD_SIGNALING   = False
+RECORD_DIR         = 'recordings'
+RECORD_FILE_BYTES  = 16 * 1024 * 1024  # rotate to a new file past this
+RECORD_TOTAL_BYTES = 256 * 1024 * 1024 # delete the oldest files past this
+
+# Connection-quality telemetry (clients batch getStats() results, see /api/debug/quality)
+TELEMETRY_INTERVAL    = 15000 # milliseconds between client telemetry batches (0 disables)
+TELEMETRY_MAX_SAMPLES = 64    # max peer samples accepted per batch
+TELEMETRY_BUFFER_SIZE = 8192  # samples kept per room (oldest are overwritten)
+TELEMETRY_WINDOW      = 120   # seconds of samples the quality matrix is built from by default
+
+
 def get_client_config():
 	'''Returns configuration needed by the JavaScript client'''
 
@@ -71,6 +124,80 @@ def get_client_config():
 			'reconnect_delay' : IRC_RECONNECT_DELAY,
 			'join_delay'      : IRC_JOIN_DELAY,
 			'max_backlog'     : IRC_MAX_BACKLOG
-		}
+		},
+		'telemetry_interval' : TELEMETRY_INTERVAL
 	}
 
+
+def validate(values: dict):
+	'''
+	Sanity check a set of settings, raising ValueError listing every problem
+
+	:param values: Setting name -> value
+	'''
+
+	problems = []
+
+	def check(name: str, valid: bool, expected: str):
+		if not valid:
+			problems.append(f'{name}={values.get(name)!r} ({expected})')
+
+	def is_int(name: str, low: int, high: int = None) -> bool:
+		value = values.get(name)
+		return isinstance(value, int) and not isinstance(value, bool) and value >= low and (high is None or value <= high)
+
+	check('MAX_USERS',             is_int('MAX_USERS', 1),                   'integer >= 1')
+	check('MAX_CAMERAS',           is_int('MAX_CAMERAS', 0),                 'integer >= 0')
+	check('SERVER_PORT',           is_int('SERVER_PORT', 1, 65535),          'port number')
+	check('LOBBY_MAX_WAITING',     is_int('LOBBY_MAX_WAITING', 0),           'integer >= 0')
+	check('CONFIG_WATCH_INTERVAL', is_int('CONFIG_WATCH_INTERVAL', 0),       'seconds >= 0')
+	check('WS_COMPRESS_MIN_SIZE',  is_int('WS_COMPRESS_MIN_SIZE', 0),        'bytes >= 0')
+	check('WS_COMPRESS_LEVEL',     is_int('WS_COMPRESS_LEVEL', 0, 9),        'zlib level 0-9')
+	check('WS_COMPRESS_WBITS',     is_int('WS_COMPRESS_WBITS', 9, 15),       'window bits 9-15')
+	check('WS_COMPRESS_MEMLEVEL',  is_int('WS_COMPRESS_MEMLEVEL', 1, 9),     'memLevel 1-9')
+	check('PRESENCE_COALESCE_MS',  is_int('PRESENCE_COALESCE_MS', 0, 1000),  'milliseconds 0-1000')
+	check('OCCUPANCY_PUSH_MIN_MS', is_int('OCCUPANCY_PUSH_MIN_MS', 0),       'milliseconds >= 0')
+	check('OCCUPANCY_PUSH_MAX_MS', is_int('OCCUPANCY_PUSH_MAX_MS', values.get('OCCUPANCY_PUSH_MIN_MS') or 0), 'milliseconds >= OCCUPANCY_PUSH_MIN_MS')
+	check('OCCUPANCY_MAX_FEEDS',   is_int('OCCUPANCY_MAX_FEEDS', 0),         'integer >= 0')
+	check('OCCUPANCY_KEEPALIVE',   is_int('OCCUPANCY_KEEPALIVE', 1),         'seconds >= 1')
+	check('TELEMETRY_INTERVAL',    is_int('TELEMETRY_INTERVAL', 0),          'milliseconds >= 0')
+	check('TELEMETRY_MAX_SAMPLES', is_int('TELEMETRY_MAX_SAMPLES', 1),       'integer >= 1')
+	check('TELEMETRY_BUFFER_SIZE', is_int('TELEMETRY_BUFFER_SIZE', 1),       'integer >= 1')
+	check('SDP_VIDEO_MIN_KBPS',    is_int('SDP_VIDEO_MIN_KBPS', 1),          'kbps >= 1')
+	check('SDP_VIDEO_MAX_KBPS',    is_int('SDP_VIDEO_MAX_KBPS', values.get('SDP_VIDEO_MIN_KBPS') or 1), 'kbps >= SDP_VIDEO_MIN_KBPS')
+	check('SDP_CODEC_ORDER',       isinstance(values.get('SDP_CODEC_ORDER'), dict), 'dict of media kind -> codec names')
+	check('RECORD_FILE_BYTES',     is_int('RECORD_FILE_BYTES', 1024),        'bytes >= 1024')
+	check('RECORD_TOTAL_BYTES',    is_int('RECORD_TOTAL_BYTES', values.get('RECORD_FILE_BYTES') or 1024), 'bytes >= RECORD_FILE_BYTES')
+	check('IRC_MAX_NICK_LENGTH',   is_int('IRC_MAX_NICK_LENGTH', 1),         'integer >= 1')
+
+	if problems:
+		raise ValueError('invalid config: ' + ', '.join(problems))
+
+
+def reload() -> dict:
+	'''
+	Re-read .env and this file, validate the result, then swap every setting in at once.
+	Returns the settings that changed (name -> new value). On any error the running config is
+	left untouched.
+	'''
+
+	if os.path.exists('.env'):
+		from dotenv import load_dotenv
+		load_dotenv(override=True)
+
+	# Build the new settings in a throwaway module so a half-applied or invalid file never
+	# becomes visible to the server
+	spec  = importlib.util.spec_from_file_location('config_reload', __file__)
+	fresh = importlib.util.module_from_spec(spec)
+	spec.loader.exec_module(fresh)
+
+	values = {name: value for name, value in vars(fresh).items() if name.isupper()}
+	validate(values)
+
+	changed = {name: value for name, value in values.items() if globals().get(name) != value}
+	globals().update(values)
+
+	return changed
+
+
+validate(globals())
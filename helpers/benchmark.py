@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+# HARDCHATS WebRTC Voice/Video Server - Developed by acidvegas (https://github.com/acidvegas/hardchats)
+# hardchats/helpers/benchmark.py
+
+'''
+Microbenchmarks for the server hot paths, run against fake sockets with 5, 25 & 250 clients.
+
+	python3 helpers/benchmark.py --save baseline.json             # record a baseline
+	python3 helpers/benchmark.py --compare baseline.json          # fail (exit 1) on regressions
+	python3 helpers/benchmark.py --compare baseline.json --save current.json --threshold 20
+'''
+
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+import server
+from presence import PresenceBatch
+
+
+CLIENT_COUNTS = (5, 25, 250)
+
+
+class FakeSocket:
+	'''Stand-in for web.WebSocketResponse that serializes like aiohttp but never touches the network'''
+
+	closed = False
+
+	def __init__(self):
+		self.sent = 0
+
+
+	async def send_json(self, data: dict, **kwargs):
+		json.dumps(data)
+		self.sent += 1
+
+
+	async def send_str(self, data: str, **kwargs):
+		self.sent += 1
+
+
+	async def send_bytes(self, data: bytes, **kwargs):
+		self.sent += 1
+
+
+	async def close(self, **kwargs):
+		self.closed = True
+
+
+def new_client(username: str = None) -> str:
+	'''Add a fake client to the server state and return its ID'''
+
+	client_id = f'c{len(server.clients):07d}'
+	while client_id in server.clients:
+		client_id += 'x'
+
+	server.clients[client_id] = server.client_state(FakeSocket())
+	server.clients[client_id]['username'] = username
+
+	return client_id
+
+
+def reset_room(size: int) -> list:
+	'''Reset global server state to a room of `size` joined fake clients'''
+
+	server.clients.clear()
+	server.captchas.clear()
+	server.reconnect_tokens.clear()
+	server.lobby.clear()
+	server.session_start = time.time()
+
+	return [new_client(f'user{i}') for i in range(size)]
+
+
+def make_cases(size: int) -> dict:
+	'''
+	Build the benchmark cases for a room of the given size.
+
+	Each case is (setup, action, teardown). setup & teardown are untimed and run around every
+	round; setup returns the argument handed to action & teardown.
+
+	:param size: The number of joined clients in the room
+	'''
+
+	room = reset_room(size)
+	peer = room[0]
+	far  = room[-1]
+
+	def setup_join():
+		server.clients.pop('bench', None)
+		server.clients['bench'] = server.client_state(FakeSocket())
+		captcha_id, _ = server.generate_captcha()
+		answer        = server.captchas[captcha_id]['answer']
+		return {'type': 'join', 'captcha_id': captcha_id, 'captcha_answer': str(answer), 'username': 'benchuser'}
+
+	def setup_reconnect():
+		server.clients.pop('bench', None)
+		server.clients['bench'] = server.client_state(FakeSocket())
+		server.reconnect_tokens['benchtoken'] = {'username': 'benchuser', 'expires': time.time() + 3600}
+		return {'type': 'reconnect', 'token': 'benchtoken'}
+
+	def teardown_bench(_):
+		server.clients.pop('bench', None)
+		server.reconnect_tokens.clear()
+
+	def setup_cleanup():
+		return new_client('leaver')
+
+	def setup_captchas():
+		# Half expired, half live, ten per client - roughly the store during a retry storm
+		server.captchas.clear()
+		now = time.time()
+		for i in range(size * 10):
+			server.captchas[f'k{i:07d}'] = {'answer': i, 'expires': now + (300 if i % 2 else -1)}
+
+	def setup_presence():
+		# A reconnect storm: a fifth of the room rejoins while everyone flips their mic
+		server.presence = PresenceBatch()
+		for cid in room:
+			server.presence.add(cid, 'main', {'type': 'mic_status', 'id': cid, 'enabled': False})
+		for cid in room[:max(size // 5, 1)]:
+			server.presence.add(cid, 'main', {'type': 'user_joined', 'id': cid, 'username': server.clients[cid]['username'], 'mic_on': True, 'cam_on': False, 'screen_on': False})
+
+	def setup_verify():
+		captcha_id, _ = server.generate_captcha()
+		return captcha_id, str(server.captchas[captcha_id]['answer'])
+
+	candidate = {'type': 'candidate', 'target': far, 'candidate': {'candidate': 'candidate:1 1 udp 2122260223 10.0.0.1 54321 typ relay', 'sdpMid': '0', 'sdpMLineIndex': 0}}
+	camera    = {'type': 'camera_status', 'enabled': True}
+	dial      = {'type': 'dial', 'sequence': '*1337#'}
+	event     = {'type': 'mic_status', 'id': peer, 'enabled': False}
+
+	return {
+		'handle_message:join'          : (setup_join,      lambda d: server.handle_message('bench', d), teardown_bench),
+		'handle_message:reconnect'     : (setup_reconnect, lambda d: server.handle_message('bench', d), teardown_bench),
+		'handle_message:candidate'     : (None,            lambda _: server.handle_message(peer, candidate), None),
+		'handle_message:camera_status' : (None,            lambda _: server.handle_message(peer, camera), lambda _: server.clients[peer].update(cam_on=False)),
+		'handle_message:dial'          : (None,            lambda _: server.handle_message(peer, dial), None),
+		'broadcast'                    : (None,            lambda _: server.broadcast(peer, event), None),
+		'broadcast_all'                : (None,            lambda _: server.broadcast_all(event), None),
+		'flush_presence'               : (setup_presence,  lambda _: server.flush_presence(), None),
+		'cleanup'                      : (setup_cleanup,   lambda cid: server.cleanup(cid), None),
+		'generate_captcha'             : (None,            lambda _: server.generate_captcha(), lambda _: server.captchas.clear()),
+		'verify_captcha'               : (setup_verify,    lambda args: server.verify_captcha(*args), None),
+		'cleanup_captchas'             : (setup_captchas,  lambda _: server.cleanup_captchas(), None)
+	}
+
+
+async def run_case(setup, action, teardown, rounds: int, warmup: int) -> dict:
+	'''
+	Time a single case, returning stats in microseconds
+
+	:param setup: Untimed callable run before each round (or None)
+	:param action: Timed callable, may return an awaitable
+	:param teardown: Untimed callable run after each round (or None)
+	:param rounds: The number of timed rounds
+	:param warmup: The number of untimed rounds to run first
+	'''
+
+	samples = []
+
+	# Keep collector pauses out of the samples (pyperf does the same)
+	gc.collect()
+	gc.disable()
+
+	try:
+		for i in range(warmup + rounds):
+			arg = setup() if setup else None
+
+			start  = time.perf_counter_ns()
+			result = action(arg)
+			if asyncio.iscoroutine(result):
+				await result
+			elapsed = time.perf_counter_ns() - start
+
+			if teardown:
+				teardown(arg)
+
+			if i >= warmup:
+				samples.append(elapsed / 1000)
+	finally:
+		gc.enable()
+
+	return {
+		'median_us' : round(statistics.median(samples), 3),
+		'mean_us'   : round(statistics.fmean(samples), 3),
+		'min_us'    : round(min(samples), 3),
+		'stdev_us'  : round(statistics.stdev(samples), 3) if len(samples) > 1 else 0.0,
+		'rounds'    : rounds
+	}
+
+
+async def run_all(sizes: tuple, rounds: int, warmup: int, only: list = None) -> dict:
+	'''
+	Run every case at every room size
+
+	:param sizes: The room sizes to simulate
+	:param rounds: The number of timed rounds per case
+	:param warmup: The number of untimed warmup rounds per case
+	:param only: Optional list of case name prefixes to restrict the run to
+	'''
+
+	results = {}
+
+	for size in sizes:
+		config.MAX_USERS   = max(config.MAX_USERS, size + 1)
+		config.MAX_CAMERAS = max(config.MAX_CAMERAS, size + 1)
+
+		# Handler cases time the immediate fan-out; the coalesced path has its own case
+		config.PRESENCE_COALESCE_MS = 0
+
+		for name in make_cases(size):
+			if only and not any(name.startswith(o) for o in only):
+				continue
+
+			# Some cases mutate the room (cleanup, dial toggles), so every case gets a fresh one
+			setup, action, teardown = make_cases(size)[name]
+
+			key   = f'{name}[{size}]'
+			stats = results[key] = await run_case(setup, action, teardown, rounds, warmup)
+
+			median, low = stats['median_us'], stats['min_us']
+
+			print(f'{key:<40} {median:>12.2f} us  (min {low:.2f})')
+
+	return results
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> list:
+	'''
+	Compare two result sets by median, returning the keys that regressed past the threshold
+
+	:param baseline: The baseline results
+	:param current: The current results
+	:param threshold: The allowed slowdown in percent
+	'''
+
+	regressions = []
+
+	print('\n' + 'case'.ljust(40), 'baseline'.rjust(12), 'current'.rjust(12), 'change'.rjust(9))
+
+	for key in sorted(baseline):
+		if key not in current:
+			continue
+
+		old    = baseline[key]['median_us']
+		new    = current[key]['median_us']
+		change = (new - old) / old * 100 if old else 0.0
+		flag   = ''
+
+		if change > threshold:
+			flag = '  REGRESSION'
+			regressions.append(key)
+
+		print(f'{key:<40} {old:>10.2f}us {new:>10.2f}us {change:>+8.1f}%{flag}')
+
+	return regressions
+
+
+def main():
+	parser = argparse.ArgumentParser(description='HARDCHATS server hot path benchmarks')
+	parser.add_argument('-s', '--save',      help='write results to this JSON baseline file')
+	parser.add_argument('-c', '--compare',   help='compare against this JSON baseline file')
+	parser.add_argument('-t', '--threshold', type=float, default=15.0, help='allowed median slowdown in percent (default: 15)')
+	parser.add_argument('-r', '--rounds',    type=int, default=500, help='timed rounds per case (default: 500)')
+	parser.add_argument('-w', '--warmup',    type=int, default=50, help='warmup rounds per case (default: 50)')
+	parser.add_argument('-n', '--clients',   type=int, nargs='+', default=list(CLIENT_COUNTS), help='room sizes to simulate (default: 5 25 250)')
+	parser.add_argument('-k', '--only',      nargs='+', help='only run cases starting with these names')
+	args = parser.parse_args()
+
+	# Keep handler logging out of the numbers (and the terminal)
+	logging.disable(logging.CRITICAL)
+
+	results = asyncio.run(run_all(tuple(args.clients), args.rounds, args.warmup, args.only))
+
+	if args.save:
+		with open(args.save, 'w') as f:
+			json.dump({'version': config.VERSION, 'python': platform.python_version(), 'created': time.time(), 'results': results}, f, indent=2)
+		print(f'\nSaved {len(results)} results to {args.save}')
+
+	if args.compare:
+		with open(args.compare) as f:
+			baseline = json.load(f)['results']
+
+		regressions = compare(baseline, results, args.threshold)
+
+		if regressions:
+			raise SystemExit(f'\n{len(regressions)} case(s) regressed more than {args.threshold}%: ' + ', '.join(regressions))
+
+		print(f'\nNo regressions beyond {args.threshold}%')
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+# HARDCHATS WebRTC Voice/Video Server - Developed by acidvegas (https://github.com/acidvegas/hardchats)
+# hardchats/helpers/replay.py
+
+'''
+Replay recorded signaling logs (see recorder.py) against the server handlers with fake sockets.
+
+	python3 helpers/replay.py recordings/                        # replay at recorded speed
+	python3 helpers/replay.py recordings/ --speed 10             # 10x faster
+	python3 helpers/replay.py recordings/*.hcr --speed 0         # as fast as possible
+	python3 helpers/replay.py recordings/ --speed 0 --profile profiles/
+
+Redacted SDP, candidates & audio are swapped for canned data of the recorded size, captchas
+always pass and reconnect tokens are re-seeded from the recorded username. At the end the
+fan-out the replay produced is compared against the fan-out that was recorded.
+'''
+
+import argparse
+import asyncio
+import glob
+import logging
+import os
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+import recorder
+import server
+from benchmark import FakeSocket
+
+
+CANNED_SDP = '\r\n'.join([
+	'v=0',
+	'o=- 4611731400430051336 2 IN IP4 127.0.0.1',
+	's=-',
+	't=0 0',
+	'a=group:BUNDLE 0 1',
+	'm=audio 9 UDP/TLS/RTP/SAVPF 111 63',
+	'c=IN IP4 0.0.0.0',
+	'a=mid:0',
+	'a=rtpmap:111 opus/48000/2',
+	'a=fmtp:111 minptime=10;useinbandfec=1',
+	'a=rtpmap:63 red/48000/2',
+	'm=video 9 UDP/TLS/RTP/SAVPF 96 97 102',
+	'c=IN IP4 0.0.0.0',
+	'a=mid:1',
+	'a=rtpmap:96 VP8/90000',
+	'a=rtpmap:97 rtx/90000',
+	'a=fmtp:97 apt=96',
+	'a=rtpmap:102 H264/90000',
+	''
+])
+
+CANNED_CANDIDATE = {'candidate': 'candidate:1 1 udp 41885439 10.0.0.1 54321 typ relay raddr 0.0.0.0 rport 0', 'sdpMid': '0', 'sdpMLineIndex': 0}
+
+
+class FanoutCounter:
+	'''Stand-in for server.recorder that tallies fan-out recipients per message type'''
+
+	enabled = True
+
+	def __init__(self):
+		self.counts = Counter()
+
+
+	def connect(self, client_id: str):
+		pass
+
+
+	def frame(self, client_id: str, data: dict):
+		pass
+
+
+	def fanout(self, msg_type: str, scope: str, recipients: int):
+		self.counts[msg_type] += recipients
+
+
+	def disconnect(self, client_id: str):
+		pass
+
+
+def canned_sdp(size: int) -> str:
+	'''
+	Canned offer/answer padded with attribute lines to roughly the recorded SDP size
+
+	:param size: The length of the original SDP
+	'''
+
+	padding = max(size - len(CANNED_SDP), 0)
+
+	return CANNED_SDP + ''.join(f'a=x-replay-pad:{"0" * 60}\r\n' for _ in range(padding // 77))
+
+
+def restore(data: dict) -> dict:
+	'''
+	Undo the recorder's redaction with stand-in data so the handlers see realistic frames
+
+	:param data: The recorded (redacted) frame
+	'''
+
+	data = dict(data)
+
+	if isinstance(data.get('sdp'), dict):
+		data['sdp'] = canned_sdp(data['sdp'].get('redacted', 0))
+
+	if isinstance(data.get('candidate'), dict) and data['candidate'].get('redacted'):
+		data['candidate'] = dict(CANNED_CANDIDATE)
+
+	if isinstance(data.get('audio'), dict):
+		data['audio'] = 'A' * data['audio'].get('redacted', 0)
+
+	if data.get('type') == 'reconnect':
+		username = data.pop('username', None)
+		if username and data.get('token'):
+			server.reconnect_tokens[data['token']] = {'username': username, 'expires': float('inf')}
+
+	return data
+
+
+def load(paths: list) -> list:
+	'''
+	Read every record from the given log files & directories, oldest first
+
+	:param paths: .hcr files or directories holding them
+	'''
+
+	files = []
+
+	for path in paths:
+		if os.path.isdir(path):
+			files.extend(sorted(glob.glob(os.path.join(path, 'signaling-*.hcr'))))
+		else:
+			files.append(path)
+
+	records = []
+
+	for path in files:
+		records.extend(recorder.read_log(path))
+
+	# Files may be passed in any order, replay follows the recorded clock
+	records.sort(key=lambda record: record[0])
+
+	return records
+
+
+async def replay(records: list, speed: float) -> tuple:
+	'''
+	Feed recorded events through the server, returning (recorded fan-out, replayed fan-out, frames)
+
+	:param records: The (time, kind, client_id, payload) records to replay
+	:param speed: 1 = recorded pace, N = N times faster, 0 = no delays
+	'''
+
+	counter  = FanoutCounter()
+	recorded = Counter()
+	frames   = 0
+
+	server.recorder = counter
+	server.verify_captcha = lambda captcha_id, user_answer: True
+
+	started    = time.monotonic()
+	origin     = records[0][0] if records else 0
+	window_end = None # recorded time the open presence window closes at
+
+	for ts, kind, client_id, payload in records:
+		if speed:
+			delay = (ts - origin) / speed - (time.monotonic() - started)
+			if delay > 0:
+				await asyncio.sleep(delay)
+
+		# Close presence windows on the recorded clock so faster replays batch like the original
+		if window_end is not None and ts >= window_end:
+			await server.flush_presence()
+			window_end = None
+
+		if kind == recorder.CONNECT:
+			server.clients[client_id] = server.client_state(FakeSocket())
+
+		elif kind == recorder.FRAME:
+			if client_id in server.clients:
+				await server.handle_message(client_id, restore(payload))
+				frames += 1
+
+		elif kind == recorder.FANOUT:
+			recorded[payload['type']] += payload['n']
+
+		elif kind == recorder.DISCONNECT:
+			if client_id in server.clients:
+				await server.cleanup(client_id)
+
+		if server.presence is not None and window_end is None:
+			window_end = ts + config.PRESENCE_COALESCE_MS / 1000
+
+	await server.flush_presence()
+
+	return recorded, counter.counts, frames
+
+
+def main():
+	parser = argparse.ArgumentParser(description='Replay HARDCHATS signaling recordings')
+	parser.add_argument('logs', nargs='+', help='.hcr log files or directories holding them')
+	parser.add_argument('-s', '--speed',   type=float, default=1.0, help='replay speed multiplier, 0 = as fast as possible (default: 1)')
+	parser.add_argument('-p', '--profile', help='profile the replay and write the trace to this directory')
+	parser.add_argument('-v', '--verbose', action='store_true', help='show server logging')
+	args = parser.parse_args()
+
+	if not args.verbose:
+		logging.disable(logging.CRITICAL)
+
+	records = load(args.logs)
+	if not records:
+		raise SystemExit('no records found')
+
+	# Replays can exceed the live limits if the logs span several rooms' worth of clients
+	config.MAX_USERS   = max(config.MAX_USERS, len({r[2] for r in records if r[1] == recorder.CONNECT}))
+	config.MAX_CAMERAS = config.MAX_USERS
+
+	if args.profile:
+		server.profiler.start()
+
+	start = time.perf_counter()
+	recorded, replayed, frames = asyncio.run(replay(records, args.speed))
+	elapsed = time.perf_counter() - start
+
+	if args.profile:
+		server.profiler.stop()
+		trace, collapsed = server.profiler.dump(args.profile)
+		print(f'Profile written to {trace} and {collapsed}')
+
+	print(f'Replayed {frames} frames from {len(records)} records in {elapsed:.2f}s ({frames / elapsed:.0f} frames/s)\n')
+	print('message'.ljust(24), 'recorded'.rjust(10), 'replayed'.rjust(10))
+
+	mismatches = 0
+
+	for msg_type in sorted(set(recorded) | set(replayed)):
+		flag = '' if recorded[msg_type] == replayed[msg_type] else '  MISMATCH'
+		mismatches += bool(flag)
+		print(f'{msg_type:<24} {recorded[msg_type]:>10} {replayed[msg_type]:>10}{flag}')
+
+	if mismatches:
+		raise SystemExit(f'\n{mismatches} message type(s) fanned out differently than recorded')
+
+
+if __name__ == '__main__':
+	main()
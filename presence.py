@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# HARDCHATS WebRTC Voice/Video Server - Developed by acidvegas (https://github.com/acidvegas/hardchats)
+# hardchats/presence.py
+
+'''
+Presence coalescing for join/reconnect storms.
+
+With config.PRESENCE_COALESCE_MS set, user_joined, user_left and the per-user status flags
+are collected for one short window and then sent as a single presence_delta frame per
+recipient, instead of one frame per change per recipient:
+
+	{'type': 'presence_delta', 'joined': [...], 'left': [...], 'gone': [...], 'status': {id: {...}}}
+
+- joined : user_joined entries, in join order (clients skip those up to their own)
+- left   : IDs that were announced before the window and left during it
+- gone   : IDs that joined & left inside the window (the pair cancels, clients only drop any
+           peer state the joiner's early signaling may have created)
+- status : latest cam_on / mic_on / screen_on / audio_only per ID, scoped to audience group
+'''
+
+
+# Status message type -> (message field, presence_delta field)
+STATUS_FIELDS = {
+	'camera_status'   : ('enabled',    'cam_on'),
+	'mic_status'      : ('enabled',    'mic_on'),
+	'screen_status'   : ('enabled',    'screen_on'),
+	'car_mode_status' : ('audio_only', 'audio_only')
+}
+
+
+class PresenceBatch:
+	'''Presence changes collected during one coalescing window'''
+
+	def __init__(self):
+		self.joined = {} # client_id -> user_joined entry (dicts keep join order)
+		self.left   = []
+		self.gone   = []
+		self.status = {} # audience group -> {client_id: {field: value}}
+
+
+	def add(self, client_id: str, group: str, message: dict):
+		'''
+		Fold a presence message into the window
+
+		:param client_id: The ID of the client the message is about
+		:param group: The client's audience group when the change happened
+		:param message: The user_joined, user_left or *_status message that would have been sent
+		'''
+
+		msg_type = message['type']
+
+		if msg_type == 'user_joined':
+			self.joined[client_id] = {key: value for key, value in message.items() if key != 'type'}
+
+		elif msg_type == 'user_left':
+			for changes in self.status.values():
+				changes.pop(client_id, None)
+
+			if self.joined.pop(client_id, None) is not None:
+				self.gone.append(client_id)
+			else:
+				self.left.append(client_id)
+
+		elif msg_type in STATUS_FIELDS:
+			source, field = STATUS_FIELDS[msg_type]
+			self.status.setdefault(group, {}).setdefault(client_id, {})[field] = message[source]
+
+
+	def delta(self, group: str) -> dict:
+		'''
+		Build the presence_delta for every recipient in an audience group, or None if nothing in
+		the window concerns them. The frame is shared, so a recipient that joined during the window
+		skips the joined entries up to & including its own (they were in its `users` list).
+
+		:param group: The recipients' audience group
+		'''
+
+		status = self.status.get(group, {})
+
+		if not (self.joined or self.left or self.gone or status):
+			return None
+
+		return {'type': 'presence_delta', 'joined': list(self.joined.values()), 'left': self.left, 'gone': self.gone, 'status': status}
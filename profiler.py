@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# HARDCHATS WebRTC Voice/Video Server - Developed by acidvegas (https://github.com/acidvegas/hardchats)
+# hardchats/profiler.py
+
+import collections
+import contextvars
+import json
+import logging
+import os
+import time
+
+
+class Profiler:
+	'''
+	On-demand span recorder for the signaling server.
+
+	Off by default. Call sites check `profiler.enabled` before opening a span, so the hot
+	path pays a single attribute lookup when profiling is off. Spans nest per asyncio task
+	(via a context var) and are kept in a bounded buffer until exported.
+	'''
+
+	def __init__(self, max_spans: int = 200000):
+		self.enabled    = False
+		self.started_at = None
+		self.spans      = collections.deque(maxlen=max_spans) # (name, lane, start_ns, dur_ns, self_ns, stack)
+		self.lanes      = {} # lane name -> chrome trace tid
+		self._stack     = contextvars.ContextVar('profiler_stack', default=())
+		self._patched   = [] # (handler, original handle method)
+
+
+	def start(self):
+		'''Start recording spans (clears any previous capture)'''
+
+		if self.enabled:
+			return
+
+		self.spans.clear()
+		self.lanes.clear()
+		self.started_at = time.perf_counter_ns()
+		self._patch_logging()
+		self.enabled = True
+		logging.info('Profiling started')
+
+
+	def stop(self):
+		'''Stop recording spans (the capture stays available for export)'''
+
+		if not self.enabled:
+			return
+
+		self.enabled = False
+		self._unpatch_logging()
+		logging.info(f'Profiling stopped ({len(self.spans)} spans)')
+
+
+	def span(self, name: str, lane: str = None):
+		'''
+		Open a timed span. Only call this when `enabled` is set.
+
+		:param name: The span name (e.g. handle_message:join)
+		:param lane: The trace lane to draw on, inherited from the parent span if omitted
+		'''
+
+		return _Span(self, name, lane)
+
+
+	def export_chrome_trace(self) -> dict:
+		'''Return the capture as a Chrome trace-event document (chrome://tracing, Perfetto)'''
+
+		base   = self.started_at or 0
+		events = [{'name': 'process_name', 'ph': 'M', 'pid': 1, 'args': {'name': 'hardchats'}}]
+
+		for lane, tid in self.lanes.items():
+			events.append({'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': tid, 'args': {'name': lane}})
+
+		for name, lane, start_ns, dur_ns, _, _ in self.spans:
+			events.append({
+				'name' : name,
+				'cat'  : name.split(':', 1)[0],
+				'ph'   : 'X',
+				'pid'  : 1,
+				'tid'  : self.lanes[lane],
+				'ts'   : (start_ns - base) / 1000,
+				'dur'  : dur_ns / 1000
+			})
+
+		return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+	def export_collapsed(self) -> str:
+		'''Return the capture as collapsed stacks (flamegraph.pl / speedscope), weighted by self time in microseconds'''
+
+		totals = collections.Counter()
+
+		for _, _, _, _, self_ns, stack in self.spans:
+			totals[stack] += self_ns
+
+		return ''.join(f'{stack} {ns // 1000}\n' for stack, ns in totals.most_common() if ns >= 1000)
+
+
+	def dump(self, directory: str) -> tuple:
+		'''
+		Write the capture to disk as <stamp>.trace.json and <stamp>.collapsed
+
+		:param directory: The directory to write into (created if missing)
+		'''
+
+		os.makedirs(directory, exist_ok=True)
+
+		stamp     = time.strftime('profile-%Y%m%d-%H%M%S')
+		trace     = os.path.join(directory, f'{stamp}.trace.json')
+		collapsed = os.path.join(directory, f'{stamp}.collapsed')
+
+		with open(trace, 'w') as f:
+			json.dump(self.export_chrome_trace(), f)
+
+		with open(collapsed, 'w') as f:
+			f.write(self.export_collapsed())
+
+		return trace, collapsed
+
+
+	def _lane_id(self, lane: str) -> int:
+		'''Map a lane name to a stable chrome trace tid'''
+
+		if lane not in self.lanes:
+			self.lanes[lane] = len(self.lanes) + 1
+
+		return self.lanes[lane]
+
+
+	def _patch_logging(self):
+		'''Time every root log handler while profiling, so log I/O shows up under the span that emitted it'''
+
+		for handler in logging.getLogger().handlers:
+			original = handler.handle
+
+			def timed(record, _original=original, _name=f'log:{type(handler).__name__}'):
+				if not self.enabled:
+					return _original(record)
+				with self.span(_name):
+					return _original(record)
+
+			handler.handle = timed
+			self._patched.append((handler, original))
+
+
+	def _unpatch_logging(self):
+		'''Restore the original log handler methods'''
+
+		for handler, original in self._patched:
+			handler.handle = original
+
+		self._patched.clear()
+
+
+class _Span:
+	'''Context manager for a single profiler span'''
+
+	__slots__ = ('profiler', 'name', 'lane', 'frame', 'token', 'start')
+
+	def __init__(self, profiler: Profiler, name: str, lane: str):
+		self.profiler = profiler
+		self.name     = name
+		self.lane     = lane
+
+
+	def __enter__(self):
+		stack = self.profiler._stack.get()
+
+		if self.lane is None:
+			self.lane = stack[-1][2] if stack else 'main'
+
+		self.profiler._lane_id(self.lane)
+
+		# frame = [name, child time in ns, lane]
+		self.frame = [self.name, 0, self.lane]
+		self.token = self.profiler._stack.set(stack + (self.frame,))
+		self.start = time.perf_counter_ns()
+
+		return self
+
+
+	def __exit__(self, *exc):
+		duration = time.perf_counter_ns() - self.start
+		stack    = self.profiler._stack.get()
+		path     = ';'.join(frame[0] for frame in stack)
+
+		self.profiler._stack.reset(self.token)
+
+		parent = self.profiler._stack.get()
+		if parent:
+			parent[-1][1] += duration
+
+		self.profiler.spans.append((self.name, self.lane, self.start, duration, max(duration - self.frame[1], 0), path))
+
+		return False
+
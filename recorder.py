@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+# HARDCHATS WebRTC Voice/Video Server - Developed by acidvegas (https://github.com/acidvegas/hardchats)
+# hardchats/recorder.py
+
+'''
+Opt-in signaling traffic recorder (replay with helpers/replay.py).
+
+Logs are a 4 byte magic followed by fixed-size record headers, each trailed by a compact
+JSON payload:
+
+	<f64 unix time> <u8 kind> <8 byte client id> <u32 payload length> <payload>
+
+SDP, ICE candidates, recording audio, captcha answers & reconnect tokens are redacted
+before anything touches the disk. Files rotate at config.RECORD_FILE_BYTES and the oldest
+are deleted once the directory passes config.RECORD_TOTAL_BYTES.
+'''
+
+import glob
+import hashlib
+import json
+import logging
+import os
+import struct
+import time
+
+import config
+
+
+MAGIC  = b'HCR1'
+HEADER = struct.Struct('<dB8sI')
+
+CONNECT    = 1 # client opened /ws
+FRAME      = 2 # inbound frame from a client (redacted)
+FANOUT     = 3 # a broadcast went out: {'type', 'scope', 'n'}
+DISCONNECT = 4 # client cleaned up
+
+
+def token_hash(token: str) -> str:
+	'''
+	Stable stand-in for a reconnect token so replays can pair reconnects without the secret
+
+	:param token: The reconnect token
+	'''
+
+	return 'tok:' + hashlib.sha256(token.encode()).hexdigest()[:16]
+
+
+def redact(data: dict, token_owner) -> dict:
+	'''
+	Strip secrets & bulky media from an inbound frame, keeping sizes so replays stay realistic
+
+	:param data: The decoded frame
+	:param token_owner: Callable mapping a reconnect token to its username (or None)
+	'''
+
+	data = dict(data)
+
+	if isinstance(data.get('sdp'), str):
+		data['sdp'] = {'redacted': len(data['sdp'])}
+
+	if data.get('candidate') is not None:
+		data['candidate'] = {'redacted': True}
+
+	if isinstance(data.get('audio'), str):
+		data['audio'] = {'redacted': len(data['audio'])}
+
+	if 'captcha_answer' in data:
+		data['captcha_answer'] = None
+
+	if data.get('type') == 'reconnect' and isinstance(data.get('token'), str):
+		data['username'] = token_owner(data['token'])
+		data['token']    = token_hash(data['token'])
+
+	return data
+
+
+class Recorder:
+	'''Appends signaling events to rotating binary logs while enabled'''
+
+	def __init__(self, token_owner):
+		self.enabled     = False
+		self.token_owner = token_owner
+		self.file        = None
+		self.written     = 0
+		self.stamp       = 0 # time.time_ns() of the newest log file
+
+
+	def start(self):
+		'''Open a fresh log file and start recording'''
+
+		if self.enabled:
+			return
+
+		self.enabled = True
+
+		if self._open():
+			logging.info(f'Signaling recorder started ({self.file.name})')
+
+
+	def stop(self):
+		'''Flush & close the current log file'''
+
+		if not self.enabled:
+			return
+
+		self.enabled = False
+		self._close()
+		logging.info('Signaling recorder stopped')
+
+
+	def connect(self, client_id: str):
+		self._write(CONNECT, client_id, b'')
+
+
+	def frame(self, client_id: str, data: dict):
+		self._write(FRAME, client_id, json.dumps(redact(data, self.token_owner), separators=(',', ':')).encode())
+
+
+	def fanout(self, msg_type: str, scope: str, recipients: int):
+		self._write(FANOUT, '', json.dumps({'type': msg_type, 'scope': scope, 'n': recipients}, separators=(',', ':')).encode())
+
+
+	def disconnect(self, client_id: str):
+		self._write(DISCONNECT, client_id, b'')
+
+
+	def _write(self, kind: int, client_id: str, payload: bytes):
+		'''Append one record, rotating first if the file is full'''
+
+		if self.written + HEADER.size + len(payload) > config.RECORD_FILE_BYTES:
+			self._close()
+			if not self._open():
+				return
+
+		try:
+			self.file.write(HEADER.pack(time.time(), kind, client_id.encode()[:8], len(payload)) + payload)
+		except OSError as e:
+			self._fail(e)
+			return
+
+		self.written += HEADER.size + len(payload)
+
+
+	def _open(self) -> bool:
+		'''Start a new log file, then delete the oldest ones past the disk budget. Returns False (recording off) on failure.'''
+
+		try:
+			os.makedirs(config.RECORD_DIR, exist_ok=True)
+
+			# Zero-padded nanosecond stamp, strictly increasing, so name order is creation order
+			# (retention deletes by it and the replay tool reads files in it)
+			self.stamp   = max(time.time_ns(), self.stamp + 1)
+			path         = os.path.join(config.RECORD_DIR, f'signaling-{self.stamp:020d}.hcr')
+			self.file    = open(path, 'wb', buffering=64 * 1024)
+			self.written = len(MAGIC)
+			self.file.write(MAGIC)
+
+			logs  = sorted(glob.glob(os.path.join(config.RECORD_DIR, 'signaling-*.hcr')))
+			total = sum(os.path.getsize(log) for log in logs) + config.RECORD_FILE_BYTES # room for the new file to fill up
+
+			for log in logs:
+				if total <= config.RECORD_TOTAL_BYTES or log == path:
+					break
+				total -= os.path.getsize(log)
+				os.remove(log)
+		except OSError as e:
+			self._fail(e)
+			return False
+
+		return True
+
+
+	def _close(self):
+		'''Close the current log file, ignoring errors from flushing a broken one'''
+
+		if self.file is not None:
+			try:
+				self.file.close()
+			except OSError:
+				pass
+			self.file = None
+
+
+	def _fail(self, error: OSError):
+		'''
+		Turn recording off after a disk error. Recording must never break signaling.
+
+		:param error: The error that stopped the recorder
+		'''
+
+		self.enabled = False
+		self._close()
+		logging.error(f'Signaling recorder stopped: {error}')
+
+
+def read_log(path: str):
+	'''
+	Yield (time, kind, client_id, payload) from a log file, payload decoded from JSON (or None)
+
+	:param path: The .hcr file to read
+	'''
+
+	with open(path, 'rb') as f:
+		if f.read(len(MAGIC)) != MAGIC:
+			raise ValueError(f'{path} is not a signaling log')
+
+		while header := f.read(HEADER.size):
+			if len(header) < HEADER.size:
+				break # truncated by a crash mid-write
+
+			ts, kind, client_id, length = HEADER.unpack(header)
+			payload = f.read(length)
+
+			if len(payload) < length:
+				break
+
+			yield ts, kind, client_id.rstrip(b'\x00').decode(), json.loads(payload) if payload else None
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# HARDCHATS WebRTC Voice/Video Server - Developed by acidvegas (https://github.com/acidvegas/hardchats)
+# hardchats/sdp.py
+
+'''
+Room SDP policy, applied to offers & answers as they pass through the signaling relay.
+
+Everything in an SDP describes what its author is willing to *receive*, so rewriting the
+author's SDP on its way to the peer shapes what that peer sends back from the very first
+packet - no renegotiation or setParameters round trip needed:
+
+	- Opus fmtp gets usedtx / useinbandfec / maxaveragebitrate
+	- payload types are reordered so the preferred codecs win negotiation
+	- video sections get b=AS + b=TIAS caps from the author's audio_only flag and the number
+	  of cameras currently on (more tiles = less per tile)
+'''
+
+import config
+
+
+def apply_policy(sdp: str, audio_only: bool, cameras: int) -> str:
+	'''
+	Rewrite an SDP blob according to the room policy
+
+	:param sdp: The SDP from the offer/answer author
+	:param audio_only: Whether the author is in car mode (audio-only)
+	:param cameras: The number of cameras currently on in the room
+	'''
+
+	eol      = '\r\n' if '\r\n' in sdp else '\n'
+	lines    = sdp.split(eol)
+	trailing = lines[-1] == ''
+
+	if trailing:
+		lines.pop()
+
+	# Split into the session block followed by one block per m= section
+	sections = [[]]
+	for line in lines:
+		if line.startswith('m='):
+			sections.append([])
+		sections[-1].append(line)
+
+	result = sections[0]
+
+	for section in sections[1:]:
+		kind = section[0][2:].split(' ', 1)[0]
+
+		if kind in config.SDP_CODEC_ORDER:
+			section = reorder_codecs(section, config.SDP_CODEC_ORDER[kind])
+
+		if kind == 'audio':
+			section = tune_opus(section, config.SDP_OPUS_MAX_BITRATE_AUDIO_ONLY if audio_only else config.SDP_OPUS_MAX_BITRATE)
+		elif kind == 'video':
+			section = set_bandwidth(section, video_cap(audio_only, cameras))
+
+		result.extend(section)
+
+	return eol.join(result) + (eol if trailing else '')
+
+
+def video_cap(audio_only: bool, cameras: int) -> int:
+	'''
+	Per-stream video receive cap in kbps
+
+	:param audio_only: Whether the receiver is in car mode (audio-only)
+	:param cameras: The number of cameras currently on in the room
+	'''
+
+	if audio_only:
+		return config.SDP_VIDEO_AUDIO_ONLY_KBPS
+
+	share = config.SDP_VIDEO_BUDGET_KBPS // max(cameras, 1)
+
+	return max(config.SDP_VIDEO_MIN_KBPS, min(config.SDP_VIDEO_MAX_KBPS, share))
+
+
+def rtpmap(section: list) -> dict:
+	'''
+	Map payload type -> upper-case codec name for a media section
+
+	:param section: The lines of the media section
+	'''
+
+	codecs = {}
+
+	for line in section:
+		if line.startswith('a=rtpmap:'):
+			pt, _, encoding = line[9:].partition(' ')
+			codecs[pt] = encoding.split('/', 1)[0].upper()
+
+	return codecs
+
+
+def reorder_codecs(section: list, order: list) -> list:
+	'''
+	Move preferred codecs to the front of the m= line payload list. Unlisted payloads (rtx,
+	red, ulpfec, ...) keep their relative order after the preferred ones.
+
+	:param section: The lines of the media section
+	:param order: Codec names in order of preference
+	'''
+
+	fields = section[0].split(' ')
+	if len(fields) < 4:
+		return section
+
+	codecs = rtpmap(section)
+	rank   = {name.upper(): i for i, name in enumerate(order)}
+	ranked = sorted(fields[3:], key=lambda pt: rank.get(codecs.get(pt), len(rank)))
+
+	return [' '.join(fields[:3] + ranked)] + section[1:]
+
+
+def tune_opus(section: list, max_bitrate: int) -> list:
+	'''
+	Set Opus DTX, in-band FEC and max average bitrate on every Opus payload type
+
+	:param section: The lines of the media section
+	:param max_bitrate: The maxaveragebitrate in bits per second
+	'''
+
+	opus = [pt for pt, name in rtpmap(section).items() if name == 'OPUS']
+	if not opus:
+		return section
+
+	wanted = {'maxaveragebitrate': str(max_bitrate)}
+	if config.SDP_OPUS_DTX:
+		wanted['usedtx'] = '1'
+	if config.SDP_OPUS_FEC:
+		wanted['useinbandfec'] = '1'
+
+	section = list(section)
+
+	for pt in opus:
+		prefix = f'a=fmtp:{pt} '
+		index  = next((i for i, line in enumerate(section) if line.startswith(prefix)), None)
+
+		if index is None:
+			# No fmtp yet - add one right after the rtpmap line
+			index = next(i for i, line in enumerate(section) if line.startswith(f'a=rtpmap:{pt} ')) + 1
+			section.insert(index, prefix + ';'.join(f'{k}={v}' for k, v in wanted.items()))
+			continue
+
+		params = {}
+		for param in section[index][len(prefix):].split(';'):
+			key, _, value = param.strip().partition('=')
+			if key:
+				params[key] = value
+
+		params.update(wanted)
+		section[index] = prefix + ';'.join(f'{k}={v}' for k, v in params.items())
+
+	return section
+
+
+def set_bandwidth(section: list, kbps: int) -> list:
+	'''
+	Replace a media section's bandwidth lines with b=AS (Chrome/Safari) and b=TIAS (Firefox)
+
+	:param section: The lines of the media section
+	:param kbps: The cap in kilobits per second
+	'''
+
+	section = [line for line in section if not line.startswith(('b=AS:', 'b=TIAS:'))]
+
+	# b= lines belong after the m=, i= and c= lines (RFC 8866 section 5)
+	index = 1
+	while index < len(section) and section[index][:2] in ('i=', 'c='):
+		index += 1
+
+	section[index:index] = [f'b=AS:{kbps}', f'b=TIAS:{kbps * 1000}']
+
+	return section
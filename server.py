@@ -2,9 +2,15 @@
 # HARDCHATS WebRTC Voice/Video Server - Developed by acidvegas (https://github.com/acidvegas/hardchats)
 # hardchats/server.py
 
+import asyncio
+import contextvars
+import hashlib
+import json
 import logging
+import os
 import random
 import secrets
+import signal
 import time
 import string
 import uuid
@@ -20,16 +26,38 @@ except ImportError:
 	raise SystemExit('missing apv library (pip install apv)')
 
 import config
+from compression import Frame, claim_compression, send_frame
+from presence import STATUS_FIELDS, PresenceBatch
+from profiler import Profiler
+from recorder import Recorder
+from sdp import apply_policy
+from telemetry import QualityRing, parse_metric
 
 
 # Globals
-clients          = {} # client_id -> {ws, username, cam_on, mic_on, screen_on}
+clients          = {} # client_id -> {ws, deflate, username, cam_on, mic_on, screen_on}
 captchas         = {} # captcha_id -> {answer, expires}
 reconnect_tokens = {} # token -> {username, expires}
+lobby            = {} # client_id -> (username, rejoin) for clients waiting on a full room, in arrival order
 session_start    = None
 trippy_mode      = False
 schizo_mode      = False
 pong_mode        = False
+profiler         = Profiler(config.PROFILE_MAX_SPANS)
+quality          = QualityRing(config.TELEMETRY_BUFFER_SIZE)
+recorder         = Recorder(lambda token: reconnect_tokens.get(token, {}).get('username'))
+presence         = None # PresenceBatch for the open coalescing window, None when closed
+presence_timer   = None # task that closes the open window
+occupancy        = 0     # joined user count, cached for /api/users/count & the occupancy feed
+occupancy_body   = b'{"count": 0}'
+occupancy_etag   = '"u0"'
+occupancy_feeds  = set() # open /api/users/stream responses
+occupancy_pushed = 0     # last count pushed to the feeds
+occupancy_task   = None  # pending coalesced push
+occupancy_delay  = config.OCCUPANCY_PUSH_MIN_MS
+occupancy_last   = 0.0   # monotonic time of the last push
+config_body      = None # pre-serialized /api/config response, rebuilt only on reload
+config_etag      = None
 
 ALLOWED_CHARS  = string.ascii_letters + string.digits + '_-'
 
@@ -180,6 +208,50 @@ def cleanup_captchas():
 		del reconnect_tokens[k]
 
 
+def client_state(ws, deflate: int = 0) -> dict:
+	'''
+	Build the per-client state entry stored in `clients`
+
+	:param ws: The client's WebSocket
+	:param deflate: The permessage-deflate window bits from claim_compression() (0 = none)
+	'''
+
+	return {'ws': ws, 'deflate': deflate, 'username': None, 'cam_on': False, 'mic_on': True, 'screen_on': False, 'rainbow_nick': False, 'ghost': False, 'fed': False, 'breakout': False, 'audio_only': False}
+
+
+def audience_of(client_id: str) -> str:
+	'''
+	Get the audience group a client belongs to. Peers in different groups never connect,
+	so signaling and media status only need to reach the sender's own group.
+
+	:param client_id: The ID of the client
+	'''
+
+	return 'breakout' if clients[client_id].get('breakout', False) else 'main'
+
+
+def audience_members(group: str) -> list:
+	'''
+	Get the IDs of every joined client in an audience group
+
+	:param group: The audience group (main or breakout)
+	'''
+
+	return [cid for cid, c in clients.items() if c['username'] and ('breakout' if c.get('breakout', False) else 'main') == group]
+
+
+def media_state(client_id: str) -> dict:
+	'''
+	Snapshot of a client's media flags, sent when audience groups change so peers that missed
+	group-scoped status updates can catch up
+
+	:param client_id: The ID of the client
+	'''
+
+	c = clients[client_id]
+	return {'id': client_id, 'cam_on': c.get('cam_on', False), 'mic_on': c.get('mic_on', True), 'screen_on': c.get('screen_on', False), 'audio_only': c.get('audio_only', False)}
+
+
 def get_camera_count() -> int:
 	'''Get the number of cameras currently on'''
 
@@ -228,18 +300,184 @@ async def get_config(request: web.Request) -> web.Response:
 	:param request: The request object
 	'''
 
-	return web.json_response(config.get_client_config())
+	if request.headers.get('If-None-Match') == config_etag:
+		return web.Response(status=304, headers={'ETag': config_etag})
+
+	return web.Response(body=config_body, content_type='application/json', headers={'ETag': config_etag, 'Cache-Control': 'no-cache'})
+
+
+def build_config_response():
+	'''Serialize the client config once and tag it, so /api/config is a plain byte copy'''
+
+	global config_body, config_etag
+
+	config_body = json.dumps(config.get_client_config()).encode()
+	config_etag = f'"{hashlib.sha1(config_body).hexdigest()[:16]}"'
+
+
+async def reload_config(reason: str):
+	'''
+	Reload config.py & .env into the running server. Invalid configs are rejected and the
+	current one stays in place. Connected clients are told when the client config changes.
+
+	:param reason: What triggered the reload (for the log)
+	'''
+
+	try:
+		changed = config.reload()
+	except Exception as e:
+		logging.error(f'Config reload ({reason}) rejected: {e}')
+		return
+
+	if not changed:
+		logging.info(f'Config reload ({reason}): no changes')
+		return
+
+	names = ', '.join(sorted(changed))
+	logging.info(f'Config reload ({reason}): {names}')
+
+	for name in ('SERVER_HOST', 'SERVER_PORT', 'PROFILE_MAX_SPANS', 'TELEMETRY_BUFFER_SIZE'):
+		if name in changed:
+			logging.warning(f'{name} only takes effect after a restart')
+
+	if 'MAX_USERS' in changed:
+		await admit_waiting()
+
+	if 'RECORD_SIGNALING' in changed:
+		set_recording(config.RECORD_SIGNALING)
+
+	old_etag = config_etag
+	build_config_response()
+
+	if config_etag != old_etag:
+		await broadcast_all({
+			'type'        : 'config_update',
+			'max_users'   : config.MAX_USERS,
+			'max_cameras' : config.MAX_CAMERAS
+		})
+
+
+async def watch_config():
+	'''Poll config.py & .env for changes and reload when either is touched'''
+
+	paths = (os.path.abspath(config.__file__), os.path.abspath('.env'))
+
+	def stamp() -> tuple:
+		return tuple(os.stat(path).st_mtime_ns if os.path.exists(path) else 0 for path in paths)
+
+	last = stamp()
+
+	while True:
+		await asyncio.sleep(max(config.CONFIG_WATCH_INTERVAL, 1))
+
+		if config.CONFIG_WATCH_INTERVAL and stamp() != last:
+			last = stamp()
+			await reload_config('file change')
 
 
 async def get_user_count(request: web.Request) -> web.Response:
 	'''
-	Get the current number of users in the room
+	Get the current number of users in the room (served from the cached count, 304 if unchanged)
 	
 	:param request: The request object
 	'''
-	
-	active_users = len([c for c in clients.values() if c['username']])
-	return web.json_response({'count': active_users})
+
+	if request.headers.get('If-None-Match') == occupancy_etag:
+		return web.Response(status=304, headers={'ETag': occupancy_etag})
+
+	return web.Response(body=occupancy_body, content_type='application/json', headers={'ETag': occupancy_etag, 'Cache-Control': 'no-cache'})
+
+
+async def occupancy_stream(request: web.Request) -> web.StreamResponse:
+	'''
+	Server-sent events feed of the joined user count for the login screen. Sends the current
+	count on connect, then only when it changes (coalesced, see occupancy_changed)
+
+	:param request: The request object
+	'''
+
+	if len(occupancy_feeds) >= config.OCCUPANCY_MAX_FEEDS:
+		return web.Response(status=503, text='Too many occupancy feeds, poll /api/users/count instead')
+
+	# X-Accel-Buffering keeps NGINX from holding events back in its proxy buffer
+	response = web.StreamResponse(headers={'Content-Type': 'text/event-stream', 'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+	await response.prepare(request)
+
+	# Registered before the first write so a push that runs while it's in flight isn't missed
+	occupancy_feeds.add(response)
+
+	try:
+		await response.write(f'retry: {config.OCCUPANCY_PUSH_MAX_MS}\ndata: {occupancy}\n\n'.encode())
+
+		# Comment lines keep idle proxies from timing the stream out, and are how a dropped
+		# client gets noticed (the write fails)
+		while True:
+			await asyncio.sleep(config.OCCUPANCY_KEEPALIVE)
+			await response.write(b': keepalive\n\n')
+	except ConnectionError:
+		pass
+	finally:
+		occupancy_feeds.discard(response)
+
+	return response
+
+
+def occupancy_changed():
+	'''
+	Refresh the cached joined count after a join or leave and schedule a push to the feeds.
+
+	Pushes are coalesced: the first change waits OCCUPANCY_PUSH_MIN_MS, and while the count
+	keeps changing every push doubles the wait up to OCCUPANCY_PUSH_MAX_MS, so a join storm
+	costs the landing page a handful of events instead of one per join.
+	'''
+
+	global occupancy, occupancy_body, occupancy_etag, occupancy_task, occupancy_delay, occupancy_pushed
+
+	count = len([c for c in clients.values() if c['username']])
+
+	if count == occupancy:
+		return
+
+	occupancy      = count
+	occupancy_body = json.dumps({'count': count}).encode()
+	occupancy_etag = f'"u{count}"'
+
+	if not occupancy_feeds:
+		occupancy_pushed = count # nobody to tell, new feeds start from the current count
+		return
+
+	if occupancy_task is None:
+		if time.monotonic() - occupancy_last > config.OCCUPANCY_PUSH_MAX_MS / 1000:
+			occupancy_delay = config.OCCUPANCY_PUSH_MIN_MS # quiet for a while, back off from scratch
+
+		occupancy_task = asyncio.create_task(push_occupancy(occupancy_delay / 1000))
+
+
+async def push_occupancy(delay: float):
+	'''
+	Send the cached count to every open occupancy feed after the coalescing delay
+
+	:param delay: Seconds to wait before pushing
+	'''
+
+	global occupancy_task, occupancy_delay, occupancy_pushed, occupancy_last
+
+	await asyncio.sleep(delay)
+	occupancy_task = None
+
+	if occupancy == occupancy_pushed:
+		return # changed and changed back inside the window
+
+	occupancy_pushed = occupancy
+	occupancy_last   = time.monotonic()
+	occupancy_delay  = min(occupancy_delay * 2, config.OCCUPANCY_PUSH_MAX_MS)
+	event            = f'data: {occupancy}\n\n'.encode()
+
+	for feed in list(occupancy_feeds):
+		try:
+			await feed.write(event)
+		except:
+			occupancy_feeds.discard(feed)
 
 
 async def leave_handler(request: web.Request) -> web.Response:
@@ -273,19 +511,24 @@ async def websocket_handler(request: web.Request) -> web.WebSocketResponse:
 
 	# Heartbeat of 30 seconds - mobile networks have hiccups longer than 5s, which would cause
 	# spurious WS reconnects that compound peer-connection rebuild issues.
-	ws = web.WebSocketResponse(heartbeat=30.0)
+	ws = web.WebSocketResponse(heartbeat=30.0, compress=config.WS_COMPRESSION)
 	await ws.prepare(request)
 
 	client_id = str(uuid.uuid4())[:8]
-	clients[client_id] = {'ws': ws, 'username': None, 'cam_on': False, 'mic_on': True, 'screen_on': False, 'rainbow_nick': False, 'ghost': False, 'fed': False, 'breakout': False, 'audio_only': False}
+	clients[client_id] = client_state(ws, claim_compression(ws))
+
+	if recorder.enabled:
+		recorder.connect(client_id)
 
 	logging.info(f'[{client_id}] Connected')
 
 	try:
 		async for msg in ws:
 			if msg.type == web.WSMsgType.TEXT:
-				data = __import__('json').loads(msg.data)
-				await handle_message(client_id, data)
+				if profiler.enabled:
+					await handle_frame_profiled(client_id, msg.data)
+				else:
+					await handle_message(client_id, json.loads(msg.data))
 			elif msg.type == web.WSMsgType.ERROR:
 				logging.error(f'[{client_id}] Error: {ws.exception()}')
 	except Exception as e:
@@ -296,6 +539,160 @@ async def websocket_handler(request: web.Request) -> web.WebSocketResponse:
 	return ws
 
 
+async def handle_frame_profiled(client_id: str, raw: str):
+	'''
+	Decode and handle a frame inside profiler spans (only used while profiling is on)
+
+	:param client_id: The ID of the client
+	:param raw: The raw text frame
+	'''
+
+	with profiler.span('frame', lane=f'client:{client_id}'):
+		with profiler.span('json_decode'):
+			data = json.loads(raw)
+		msg_type = data.get('type')
+		with profiler.span(f'handle_message:{msg_type}'):
+			await handle_message(client_id, data)
+
+
+def username_taken(client_id: str, username: str) -> bool:
+	'''
+	Check if a username (case-insensitive) is used by another joined client or lobby waiter
+
+	:param client_id: The ID of the client asking
+	:param username: The requested username
+	'''
+
+	name = username.lower()
+
+	for cid, c in clients.items():
+		if cid != client_id and c['username'] and c['username'].lower() == name:
+			return True
+
+	return any(cid != client_id and waiting.lower() == name for cid, (waiting, _) in lobby.items())
+
+
+def room_full() -> bool:
+	'''Check if a new client has to wait (no free slot, or others are already waiting for one)'''
+
+	return bool(lobby) or len([c for c in clients.values() if c['username']]) >= config.MAX_USERS
+
+
+async def enqueue(client_id: str, username: str, rejoin: bool):
+	'''
+	Put a client that passed the captcha/token check in the lobby, or turn it away if the lobby is full
+
+	:param client_id: The ID of the client
+	:param username: The username it will join as
+	:param rejoin: Whether it came in through a reconnect token
+	'''
+
+	if len(lobby) >= config.LOBBY_MAX_WAITING:
+		await send(client_id, {'type': 'error', 'message': 'Room is full'})
+		return
+
+	lobby[client_id] = (username, rejoin)
+	logging.info(f'[{client_id}] Waiting in lobby as {username} (position {len(lobby)})')
+
+	await send(client_id, {'type': 'lobby', 'position': len(lobby), 'max_users': config.MAX_USERS})
+
+
+async def admit(client_id: str, username: str, rejoin: bool):
+	'''
+	Join a client to the room: hand out a reconnect token, send it the roster & announce it
+
+	:param client_id: The ID of the client
+	:param username: The username it joins as
+	:param rejoin: Whether it came in through a reconnect token (no join sound)
+	'''
+
+	global session_start
+
+	clients[client_id]['username'] = username
+	occupancy_changed()
+
+	if session_start is None:
+		session_start = time.time()
+
+	logging.info(f'[{client_id}] {"Reconnected" if rejoin else "Joined"} as {username}')
+
+	# Generate reconnect token for this user
+	reconnect_token = secrets.token_urlsafe(32)
+	reconnect_tokens[reconnect_token] = {'username': username, 'expires': time.time() + 3600}
+
+	users = [
+		{'id': cid, 'username': c['username'], 'cam_on': c.get('cam_on', False), 'mic_on': c.get('mic_on', True), 'screen_on': c.get('screen_on', False), 'rainbow_nick': c.get('rainbow_nick', False), 'ghost': c.get('ghost', False), 'fed': c.get('fed', False), 'breakout': c.get('breakout', False), 'audio_only': c.get('audio_only', False)}
+		for cid, c in clients.items()
+		if c['username'] and cid != client_id
+	]
+
+	await send(client_id, {
+		'type'            : 'users',
+		'users'           : users,
+		'you'             : client_id,
+		'session_start'   : session_start,
+		'max_cameras'     : config.MAX_CAMERAS,
+		'reconnect_token' : reconnect_token,
+		'trippy_mode'     : trippy_mode,
+		'schizo_mode'     : schizo_mode,
+		'pong_mode'       : pong_mode,
+		'group'           : audience_of(client_id),
+		'peers'           : [cid for cid in audience_members(audience_of(client_id)) if cid != client_id]
+	})
+
+	message = {
+		'type'      : 'user_joined',
+		'id'        : client_id,
+		'username'  : username,
+		'mic_on'    : clients[client_id].get('mic_on', True),
+		'cam_on'    : clients[client_id].get('cam_on', False),
+		'screen_on' : clients[client_id].get('screen_on', False)
+	}
+
+	# Join-sound easter egg, rolled once server-side so the whole room hears the same
+	# thing. Only on genuine joins, not reconnects (which are frequent on mobile).
+	if not rejoin:
+		message['join_sound'] = roll_join_sound()
+
+	await publish_presence(client_id, message)
+
+
+async def admit_waiting():
+	'''Admit lobby waiters in FIFO order while there are free slots, then push the new positions'''
+
+	admitted = False
+
+	while lobby and len([c for c in clients.values() if c['username']]) < config.MAX_USERS:
+		client_id = next(iter(lobby))
+		username, rejoin = lobby.pop(client_id)
+		admitted = True
+
+		# A waiter whose socket already died is left to its own cleanup, the slot goes to the next
+		if client_id not in clients or clients[client_id]['ws'].closed:
+			continue
+
+		try:
+			await admit(client_id, username, rejoin)
+		except Exception as e:
+			logging.warning(f'[{client_id}] Admission failed: {e}')
+			clients[client_id]['username'] = None
+			occupancy_changed()
+
+	if admitted:
+		await update_lobby_positions()
+
+
+async def update_lobby_positions():
+	'''Push every lobby waiter its current place in line'''
+
+	for position, client_id in enumerate(list(lobby), 1):
+		if client_id in clients:
+			try:
+				await send(client_id, {'type': 'lobby', 'position': position, 'max_users': config.MAX_USERS})
+			except:
+				pass
+
+
 async def handle_message(client_id: str, data: dict):
 	'''
 	Handle messages from the client
@@ -304,147 +701,82 @@ async def handle_message(client_id: str, data: dict):
 	:param data: The data from the client
 	'''
 
-	global session_start, trippy_mode, schizo_mode, pong_mode
 	msg_type = data.get('type')
 
+	if recorder.enabled:
+		recorder.frame(client_id, data)
+
+	if msg_type in ('join', 'reconnect') and client_id in lobby:
+		return # already waiting for a slot
+
 	if msg_type == 'join':
 		if not verify_captcha(data.get('captcha_id'), data.get('captcha_answer')):
-			await clients[client_id]['ws'].send_json({'type': 'error', 'message': 'Invalid captcha'})
+			await send(client_id, {'type': 'error', 'message': 'Invalid captcha'})
 			return
 
 		username = data.get('username', '').strip()
 		if not username or username[0].isdigit() or not all(c in ALLOWED_CHARS for c in username) or len(username) > 20:
-			await clients[client_id]['ws'].send_json({'type': 'error', 'message': 'Invalid username. Must start with a letter, 1-20 characters (letters, numbers, underscore).'})
+			await send(client_id, {'type': 'error', 'message': 'Invalid username. Must start with a letter, 1-20 characters (letters, numbers, underscore).'})
 			return
 
-		# Check for duplicate username (case-insensitive)
-		for cid, c in clients.items():
-			if cid != client_id and c['username'] and c['username'].lower() == username.lower():
-				await clients[client_id]['ws'].send_json({'type': 'error', 'message': 'Username already in use. Please choose a different name.'})
-				return
-
-		active_users = len([c for c in clients.values() if c['username']])
-		if active_users >= config.MAX_USERS:
-			await clients[client_id]['ws'].send_json({'type': 'error', 'message': 'Room is full'})
+		# Check for duplicate username (case-insensitive), including anyone waiting in the lobby
+		if username_taken(client_id, username):
+			await send(client_id, {'type': 'error', 'message': 'Username already in use. Please choose a different name.'})
 			return
 
-		clients[client_id]['username'] = username
-
-		if session_start is None:
-			session_start = time.time()
-
-		logging.info(f'[{client_id}] Joined as {username}')
-
-		# Generate reconnect token for this user
-		reconnect_token = secrets.token_urlsafe(32)
-		reconnect_tokens[reconnect_token] = {'username': username, 'expires': time.time() + 3600}
-
-		users = [
-			{'id': cid, 'username': c['username'], 'cam_on': c.get('cam_on', False), 'mic_on': c.get('mic_on', True), 'screen_on': c.get('screen_on', False), 'rainbow_nick': c.get('rainbow_nick', False), 'ghost': c.get('ghost', False), 'fed': c.get('fed', False), 'breakout': c.get('breakout', False), 'audio_only': c.get('audio_only', False)}
-			for cid, c in clients.items()
-			if c['username'] and cid != client_id
-		]
-
-		await clients[client_id]['ws'].send_json({
-			'type'            : 'users',
-			'users'           : users,
-			'you'             : client_id,
-			'session_start'   : session_start,
-			'max_cameras'     : config.MAX_CAMERAS,
-			'reconnect_token' : reconnect_token,
-			'trippy_mode'     : trippy_mode,
-			'schizo_mode'     : schizo_mode,
-			'pong_mode'       : pong_mode
-		})
-
-		# Join-sound easter egg, rolled once server-side so the whole room hears the same
-		# thing. Only on genuine joins, not reconnects (which are frequent on mobile).
-		join_sound = roll_join_sound()
+		if room_full():
+			await enqueue(client_id, username, False)
+			return
 
-		await broadcast(client_id, {
-			'type'      : 'user_joined',
-			'id'        : client_id,
-			'username'  : username,
-			'mic_on'    : clients[client_id].get('mic_on', True),
-			'cam_on'    : clients[client_id].get('cam_on', False),
-			'screen_on' : clients[client_id].get('screen_on', False),
-			'join_sound': join_sound
-		})
+		await admit(client_id, username, False)
 
 	elif msg_type == 'reconnect':
 		token = data.get('token')
 
 		# Validate reconnect token
 		if not token or token not in reconnect_tokens:
-			await clients[client_id]['ws'].send_json({'type': 'error', 'message': 'Invalid reconnect token'})
+			await send(client_id, {'type': 'error', 'message': 'Invalid reconnect token'})
 			return
 
 		token_data = reconnect_tokens[token]
 		if time.time() > token_data['expires']:
 			del reconnect_tokens[token]
-			await clients[client_id]['ws'].send_json({'type': 'error', 'message': 'Reconnect token expired'})
+			await send(client_id, {'type': 'error', 'message': 'Reconnect token expired'})
 			return
 
 		username = token_data['username']
 		del reconnect_tokens[token]  # Consume the old token
 
 		# Check for duplicate username (skip if it's the same user reconnecting)
-		for cid, c in clients.items():
-			if cid != client_id and c['username'] and c['username'].lower() == username.lower():
-				await clients[client_id]['ws'].send_json({'type': 'error', 'message': 'Username already in use'})
-				return
-
-		active_users = len([c for c in clients.values() if c['username']])
-		if active_users >= config.MAX_USERS:
-			await clients[client_id]['ws'].send_json({'type': 'error', 'message': 'Room is full'})
+		if username_taken(client_id, username):
+			await send(client_id, {'type': 'error', 'message': 'Username already in use'})
 			return
 
-		clients[client_id]['username'] = username
-
-		if session_start is None:
-			session_start = time.time()
-
-		logging.info(f'[{client_id}] Reconnected as {username}')
-
-		# Generate a new reconnect token
-		new_token = secrets.token_urlsafe(32)
-		reconnect_tokens[new_token] = {'username': username, 'expires': time.time() + 3600}
-
-		users = [
-			{'id': cid, 'username': c['username'], 'cam_on': c.get('cam_on', False), 'mic_on': c.get('mic_on', True), 'screen_on': c.get('screen_on', False), 'rainbow_nick': c.get('rainbow_nick', False), 'ghost': c.get('ghost', False), 'fed': c.get('fed', False), 'breakout': c.get('breakout', False), 'audio_only': c.get('audio_only', False)}
-			for cid, c in clients.items()
-			if c['username'] and cid != client_id
-		]
-
-		await clients[client_id]['ws'].send_json({
-			'type'            : 'users',
-			'users'           : users,
-			'you'             : client_id,
-			'session_start'   : session_start,
-			'max_cameras'     : config.MAX_CAMERAS,
-			'reconnect_token' : new_token,
-			'trippy_mode'     : trippy_mode,
-			'schizo_mode'     : schizo_mode,
-			'pong_mode'       : pong_mode
-		})
+		if room_full():
+			await enqueue(client_id, username, True)
+			return
 
-		await broadcast(client_id, {
-			'type'     : 'user_joined',
-			'id'       : client_id,
-			'username' : username,
-			'mic_on'   : clients[client_id].get('mic_on', True),
-			'cam_on'   : clients[client_id].get('cam_on', False),
-			'screen_on': clients[client_id].get('screen_on', False)
-		})
+		await admit(client_id, username, True)
 
 	elif msg_type in ('offer', 'answer', 'candidate'):
+		# Peers in different audience groups are never connected, so cross-group
+		# signaling is dropped rather than relayed.
 		target = data.get('target')
-		if target and target in clients and clients[target]['username']:
-			await clients[target]['ws'].send_json({
+		if target and target in clients and clients[target]['username'] and audience_of(target) == audience_of(client_id):
+			sdp = data.get('sdp')
+			if config.SDP_POLICY and msg_type != 'candidate' and isinstance(sdp, str):
+				# The author's SDP tells the target what to send back, so policy follows the
+				# author's car mode flag. A malformed SDP is forwarded untouched and left for
+				# the browser to reject.
+				try:
+					sdp = apply_policy(sdp, clients[client_id].get('audio_only', False), get_camera_count())
+				except Exception as e:
+					logging.warning(f'[{client_id}] SDP policy skipped: {e}')
+			await send(target, {
 				'type'      : msg_type,
 				'from'      : client_id,
 				'username'  : clients[client_id]['username'],
-				'sdp'       : data.get('sdp'),
+				'sdp'       : sdp,
 				'candidate' : data.get('candidate')
 			})
 
@@ -452,7 +784,7 @@ async def handle_message(client_id: str, data: dict):
 		enabled = data.get('enabled', False)
 
 		if enabled and get_camera_count() >= config.MAX_CAMERAS:
-			await clients[client_id]['ws'].send_json({
+			await send(client_id, {
 				'type'    : 'error',
 				'message' : f'Maximum cameras ({config.MAX_CAMERAS}) reached'
 			})
@@ -460,8 +792,8 @@ async def handle_message(client_id: str, data: dict):
 
 		clients[client_id]['cam_on'] = enabled
 
-		# Broadcast to ALL users including sender
-		await broadcast_all({
+		# Broadcast to the sender's audience group including sender
+		await publish_presence(client_id, {
 			'type'    : 'camera_status',
 			'id'      : client_id,
 			'enabled' : enabled
@@ -472,20 +804,20 @@ async def handle_message(client_id: str, data: dict):
 		clients[client_id]['mic_on'] = enabled
 		logging.info(f'[{client_id}] Mic status changed to: {enabled}')
 
-		# Broadcast to ALL users including sender
-		await broadcast_all({
+		# Broadcast to the sender's audience group including sender
+		await publish_presence(client_id, {
 			'type'    : 'mic_status',
 			'id'      : client_id,
 			'enabled' : enabled
 		})
-		logging.info(f'[{client_id}] Broadcasted mic_status to all clients')
+		logging.info(f'[{client_id}] Broadcasted mic_status to {audience_of(client_id)} audience')
 
 	elif msg_type == 'screen_status':
 		enabled = data.get('enabled', False)
 		clients[client_id]['screen_on'] = enabled
 
-		# Broadcast to ALL users including sender
-		await broadcast_all({
+		# Broadcast to the sender's audience group including sender
+		await publish_presence(client_id, {
 			'type'    : 'screen_status',
 			'id'      : client_id,
 			'enabled' : enabled
@@ -505,18 +837,35 @@ async def handle_message(client_id: str, data: dict):
 			await broadcast_all({'type': 'play_sound', 'sound': sound})
 
 	elif msg_type == 'car_mode':
-		# Car mode = audio-only. We track the flag and fan it out so every other client
+		# Car mode = audio-only. We track the flag and fan it out so every connected peer
 		# pauses the video/screen streams they send to this user (client-side, via
 		# RTCRtpSender encodings.active). Server just relays state.
 		enabled = bool(data.get('enabled', False))
 		clients[client_id]['audio_only'] = enabled
 		logging.info(f'[{client_id}] Car mode -> {enabled}')
-		await broadcast_all({
+		await publish_presence(client_id, {
 			'type'       : 'car_mode_status',
 			'id'         : client_id,
 			'audio_only' : enabled
 		})
 
+	elif msg_type == 'telemetry':
+		# Batched getStats() results from webrtc.js, one compact row per peer:
+		# [peer_id, rtt_ms, jitter_ms, loss_pct, available_outgoing_kbps]. Rows for
+		# unknown peers or malformed shapes are skipped; bad numbers become NaN.
+		reporter = clients[client_id]['username']
+		samples  = data.get('samples')
+		if not reporter or not isinstance(samples, list) or len(samples) > config.TELEMETRY_MAX_SAMPLES:
+			return
+		now = time.time()
+		for sample in samples:
+			if not isinstance(sample, list) or len(sample) != 5:
+				continue
+			peer = clients.get(sample[0]) if isinstance(sample[0], str) else None
+			if not peer or not peer['username']:
+				continue
+			quality.add(now, reporter, peer['username'], *(parse_metric(v) for v in sample[1:]))
+
 	elif msg_type == 'leave':
 		# Explicit leave message for immediate cleanup (triggered on tab close)
 		await cleanup(client_id)
@@ -541,6 +890,7 @@ async def handle_message(client_id: str, data: dict):
 		clients[client_id]['fed'] = True
 		logging.info(f'[{client_id}] Tagged as FED')
 		# Broadcast to everyone EXCEPT the dialer - they should never know.
+		await settle_presence()
 		await broadcast(client_id, {
 			'type' : 'fed_status',
 			'id'   : client_id,
@@ -555,87 +905,133 @@ async def handle_message(client_id: str, data: dict):
 		if len(sequence) > DIAL_MAX_LEN:
 			return
 		action = DIAL_CODES.get(sequence)
-		if action == 'trippy_toggle':
-			trippy_mode = not trippy_mode
-			logging.info(f'[{client_id}] Trippy mode -> {trippy_mode}')
-			await broadcast_all({'type': 'trippy_status', 'enabled': trippy_mode})
-		elif action == 'sound_menu':
-			# Private trigger - only the dialer's soundboard popup opens. Picking a sound
-			# there sends a 'play_soundboard' message that fans out to everyone.
-			logging.info(f'[{client_id}] Soundboard open')
-			await clients[client_id]['ws'].send_json({'type': 'sound_menu_open'})
-		elif action == 'voice_changer':
-			# Private trigger - only the dialer's UI opens the voice changer popup. The FX
-			# are applied client-side to the dialer's own outgoing audio.
-			logging.info(f'[{client_id}] Voice changer open')
-			await clients[client_id]['ws'].send_json({'type': 'voice_changer_open'})
-		elif action == 'schizo_toggle':
-			schizo_mode = not schizo_mode
-			logging.info(f'[{client_id}] Schizo mode -> {schizo_mode}')
-			await broadcast_all({'type': 'schizo_status', 'enabled': schizo_mode})
-		elif action == 'pong_toggle':
-			pong_mode = not pong_mode
-			logging.info(f'[{client_id}] Pong mode -> {pong_mode}')
-			await broadcast_all({'type': 'pong_status', 'enabled': pong_mode})
-		elif action == 'reset_all':
-			# Wipes every per-user effect and global mode. Server state is reset so
-			# future joiners don't inherit stale flags.
-			trippy_mode = False
-			schizo_mode = False
-			pong_mode   = False
-			for c in clients.values():
-				c['rainbow_nick'] = False
-				c['ghost']        = False
-			logging.info(f'[{client_id}] Reset all modes')
-			await broadcast_all({'type': 'reset_all'})
-		elif action == 'breakout_toggle':
-			# Per-user toggle. Audio gating is handled client-side: each client mutes
-			# the sender track + receiver audio for any peer whose breakout flag
-			# doesn't match their own. Server just tracks state and fans out.
-			current = clients[client_id].get('breakout', False)
-			clients[client_id]['breakout'] = not current
-			logging.info(f'[{client_id}] Breakout -> {not current}')
-			await broadcast_all({
-				'type'     : 'breakout_status',
-				'id'       : client_id,
-				'breakout' : not current
-			})
-		elif action == 'ghost_toggle':
-			current = clients[client_id].get('ghost', False)
-			clients[client_id]['ghost'] = not current
-			logging.info(f'[{client_id}] Ghost mode -> {not current}')
-			await broadcast_all({
-				'type'  : 'ghost_status',
-				'id'    : client_id,
-				'ghost' : not current
-			})
-		elif action == 'show_codes':
-			# Private reply to just the dialer - other clients never see the codes.
-			logging.info(f'[{client_id}] Dial code list requested')
-			await clients[client_id]['ws'].send_json({
-				'type'  : 'dial_codes_list',
-				'codes' : [{'code': c, 'desc': d} for (c, d) in DIAL_CODE_DESCRIPTIONS]
-			})
-		elif action == 'record_open':
-			# Private trigger - only the dialer's UI opens the record popup.
-			logging.info(f'[{client_id}] Record popup open')
-			await clients[client_id]['ws'].send_json({'type': 'record_popup_open'})
-		elif action == 'play_recording':
-			# Ask the dialer's client to upload its last recording. We then broadcast
-			# the audio to everyone via 'broadcast_recording' below.
-			logging.info(f'[{client_id}] Play recording requested')
-			await clients[client_id]['ws'].send_json({'type': 'request_broadcast_recording'})
-		elif action == 'rainbow_nick_toggle':
-			# Per-user toggle: only flips the dialer's own nick. Broadcast so every
-			# other client renders the rainbow effect on this user in their list.
-			current = clients[client_id].get('rainbow_nick', False)
-			clients[client_id]['rainbow_nick'] = not current
-			logging.info(f'[{client_id}] Rainbow nick -> {not current}')
-			await broadcast_all({
-				'type'    : 'nick_status',
-				'id'      : client_id,
-				'rainbow' : not current
-			})
+		if not action:
+			return
+		if profiler.enabled:
+			with profiler.span(f'dial:{action}'):
+				await handle_dial(client_id, action)
+		else:
+			await handle_dial(client_id, action)
+
+
+async def handle_dial(client_id: str, action: str):
+	'''
+	Run a dial code action for the dialer
+
+	:param client_id: The ID of the dialer
+	:param action: The action name from DIAL_CODES
+	'''
+
+	global trippy_mode, schizo_mode, pong_mode
+
+	if action == 'trippy_toggle':
+		trippy_mode = not trippy_mode
+		logging.info(f'[{client_id}] Trippy mode -> {trippy_mode}')
+		await broadcast_all({'type': 'trippy_status', 'enabled': trippy_mode})
+	elif action == 'sound_menu':
+		# Private trigger - only the dialer's soundboard popup opens. Picking a sound
+		# there sends a 'play_soundboard' message that fans out to everyone.
+		logging.info(f'[{client_id}] Soundboard open')
+		await send(client_id, {'type': 'sound_menu_open'})
+	elif action == 'voice_changer':
+		# Private trigger - only the dialer's UI opens the voice changer popup. The FX
+		# are applied client-side to the dialer's own outgoing audio.
+		logging.info(f'[{client_id}] Voice changer open')
+		await send(client_id, {'type': 'voice_changer_open'})
+	elif action == 'schizo_toggle':
+		schizo_mode = not schizo_mode
+		logging.info(f'[{client_id}] Schizo mode -> {schizo_mode}')
+		await broadcast_all({'type': 'schizo_status', 'enabled': schizo_mode})
+	elif action == 'pong_toggle':
+		pong_mode = not pong_mode
+		logging.info(f'[{client_id}] Pong mode -> {pong_mode}')
+		await broadcast_all({'type': 'pong_status', 'enabled': pong_mode})
+	elif action == 'reset_all':
+		# Wipes every per-user effect and global mode. Server state is reset so
+		# future joiners don't inherit stale flags.
+		trippy_mode = False
+		schizo_mode = False
+		pong_mode   = False
+		for c in clients.values():
+			c['rainbow_nick'] = False
+			c['ghost']        = False
+		logging.info(f'[{client_id}] Reset all modes')
+		await broadcast_all({'type': 'reset_all'})
+	elif action == 'breakout_toggle':
+		# Per-user toggle that moves the dialer between audience groups. Everyone
+		# gets breakout_status for the roster, then topology hints so the old group
+		# drops its peer connections to the dialer, the new group learns the dialer's
+		# media state, and the dialer connects to the new group (and only that group).
+		old_group = audience_of(client_id)
+		current   = clients[client_id].get('breakout', False)
+		clients[client_id]['breakout'] = not current
+		new_group = audience_of(client_id)
+		logging.info(f'[{client_id}] Breakout -> {not current}')
+		await settle_presence()
+		await broadcast_all({
+			'type'     : 'breakout_status',
+			'id'       : client_id,
+			'breakout' : not current
+		})
+		await broadcast_group(old_group, {'type': 'topology', 'drop': [client_id]})
+		await broadcast_group(new_group, {'type': 'topology', 'add': [media_state(client_id)]}, exclude=client_id)
+		peers = [cid for cid in audience_members(new_group) if cid != client_id]
+		await send(client_id, {
+			'type'  : 'topology',
+			'group' : new_group,
+			'peers' : peers,
+			'users' : [media_state(cid) for cid in peers]
+		})
+	elif action == 'ghost_toggle':
+		current = clients[client_id].get('ghost', False)
+		clients[client_id]['ghost'] = not current
+		logging.info(f'[{client_id}] Ghost mode -> {not current}')
+		await settle_presence()
+		await broadcast_all({
+			'type'  : 'ghost_status',
+			'id'    : client_id,
+			'ghost' : not current
+		})
+	elif action == 'show_codes':
+		# Private reply to just the dialer - other clients never see the codes.
+		logging.info(f'[{client_id}] Dial code list requested')
+		await send(client_id, {
+			'type'  : 'dial_codes_list',
+			'codes' : [{'code': c, 'desc': d} for (c, d) in DIAL_CODE_DESCRIPTIONS]
+		})
+	elif action == 'record_open':
+		# Private trigger - only the dialer's UI opens the record popup.
+		logging.info(f'[{client_id}] Record popup open')
+		await send(client_id, {'type': 'record_popup_open'})
+	elif action == 'play_recording':
+		# Ask the dialer's client to upload its last recording. We then broadcast
+		# the audio to everyone via the 'broadcast_recording' message.
+		logging.info(f'[{client_id}] Play recording requested')
+		await send(client_id, {'type': 'request_broadcast_recording'})
+	elif action == 'rainbow_nick_toggle':
+		# Per-user toggle: only flips the dialer's own nick. Broadcast so every
+		# other client renders the rainbow effect on this user in their list.
+		current = clients[client_id].get('rainbow_nick', False)
+		clients[client_id]['rainbow_nick'] = not current
+		logging.info(f'[{client_id}] Rainbow nick -> {not current}')
+		await settle_presence()
+		await broadcast_all({
+			'type'    : 'nick_status',
+			'id'      : client_id,
+			'rainbow' : not current
+		})
+
+
+async def send(client_id: str, message: dict):
+	'''
+	Send a message to a single client
+
+	:param client_id: The ID of the client
+	:param message: The message to send
+	'''
+
+	client = clients[client_id]
+	await send_frame(client['ws'], Frame(message), client.get('deflate', 0))
 
 
 async def broadcast(sender_id: str, message: dict):
@@ -646,14 +1042,31 @@ async def broadcast(sender_id: str, message: dict):
 	:param message: The message to send
 	'''
 
+	if profiler.enabled:
+		with profiler.span('broadcast'):
+			return await _broadcast(sender_id, message)
+
+	await _broadcast(sender_id, message)
+
+
+async def _broadcast(sender_id: str, message: dict):
+	'''Fan-out loop behind broadcast()'''
+
+	frame = Frame(message)
+	sent  = 0
+
 	# Send to all except sender
 	for cid, client in list(clients.items()):
 		if cid != sender_id and client['ws'] and not client['ws'].closed and client['username']:
 			try:
-				await client['ws'].send_json(message)
+				await send_frame(client['ws'], frame, client.get('deflate', 0))
+				sent += 1
 			except:
 				pass
 
+	if recorder.enabled:
+		recorder.fanout(message.get('type'), 'others', sent)
+
 
 async def broadcast_all(message: dict):
 	'''
@@ -662,14 +1075,182 @@ async def broadcast_all(message: dict):
 	:param message: The message to send
 	'''
 
+	if profiler.enabled:
+		with profiler.span('broadcast_all'):
+			return await _broadcast_all(message)
+
+	await _broadcast_all(message)
+
+
+async def _broadcast_all(message: dict):
+	'''Fan-out loop behind broadcast_all()'''
+
+	frame = Frame(message)
+	sent  = 0
+
 	# Send to all including sender
 	for cid, client in list(clients.items()):
 		if client['ws'] and not client['ws'].closed and client['username']:
 			try:
-				await client['ws'].send_json(message)
+				await send_frame(client['ws'], frame, client.get('deflate', 0))
+				sent += 1
 			except:
 				pass
 
+	if recorder.enabled:
+		recorder.fanout(message.get('type'), 'all', sent)
+
+
+async def broadcast_group(group: str, message: dict, exclude: str = None):
+	'''
+	Send to every joined client in an audience group
+
+	:param group: The audience group (main or breakout)
+	:param message: The message to send
+	:param exclude: Optional client ID to skip
+	'''
+
+	if profiler.enabled:
+		with profiler.span('broadcast_group'):
+			return await _broadcast_group(group, message, exclude)
+
+	await _broadcast_group(group, message, exclude)
+
+
+async def _broadcast_group(group: str, message: dict, exclude: str):
+	'''Fan-out loop behind broadcast_group()'''
+
+	frame = Frame(message)
+	sent  = 0
+
+	for cid in audience_members(group):
+		client = clients.get(cid)
+		if cid != exclude and client and client['ws'] and not client['ws'].closed:
+			try:
+				await send_frame(client['ws'], frame, client.get('deflate', 0))
+				sent += 1
+			except:
+				pass
+
+	if recorder.enabled:
+		recorder.fanout(message.get('type'), group, sent)
+
+
+async def broadcast_audience(sender_id: str, message: dict):
+	'''
+	Send to everyone in the sender's audience group, including the sender
+
+	:param sender_id: The ID of the sender
+	:param message: The message to send
+	'''
+
+	await broadcast_group(audience_of(sender_id), message)
+
+
+async def publish_presence(client_id: str, message: dict):
+	'''
+	Fan out a presence change (user_joined, user_left or a status flag) right away, or fold it
+	into the open coalescing window when config.PRESENCE_COALESCE_MS is set
+
+	:param client_id: The ID of the client the change is about
+	:param message: The message to send
+	'''
+
+	global presence, presence_timer
+
+	msg_type = message['type']
+
+	if not config.PRESENCE_COALESCE_MS:
+		if msg_type == 'user_joined':
+			await broadcast(client_id, message)
+		elif msg_type == 'user_left':
+			await broadcast_all(message)
+		else:
+			await broadcast_audience(client_id, message)
+		return
+
+	if presence is None:
+		presence       = PresenceBatch()
+		# Fresh context so the flush isn't profiled under (and on the lane of) the frame that opened the window
+		presence_timer = asyncio.create_task(close_presence_window(presence, config.PRESENCE_COALESCE_MS / 1000), context=contextvars.Context())
+
+	presence.add(client_id, audience_of(client_id) if msg_type in STATUS_FIELDS else None, message)
+
+
+async def close_presence_window(batch: PresenceBatch, delay: float):
+	'''
+	Flush a coalescing window once it expires, unless it was already flushed
+
+	:param batch: The window this timer belongs to
+	:param delay: The window length in seconds
+	'''
+
+	await asyncio.sleep(delay)
+
+	if batch is presence:
+		await flush_presence()
+
+
+async def settle_presence():
+	'''
+	Flush the open coalescing window before a room-wide per-user event (ghost, nick, fed,
+	breakout), so it can't reach clients ahead of the join of the user it is about
+	'''
+
+	if presence is not None:
+		await flush_presence()
+
+
+async def flush_presence():
+	'''Close the open coalescing window and send each joined client its presence_delta'''
+
+	if profiler.enabled:
+		with profiler.span('flush_presence'):
+			return await _flush_presence()
+
+	await _flush_presence()
+
+
+async def _flush_presence():
+	'''Per-recipient fan-out behind flush_presence()'''
+
+	global presence, presence_timer
+
+	batch, presence = presence, None
+
+	if batch is None:
+		return
+
+	# Flushed early (settle_presence, replays): the window's timer has nothing left to do
+	if presence_timer is not None and presence_timer is not asyncio.current_task():
+		presence_timer.cancel()
+	presence_timer = None
+
+	frames = {} # audience group -> Frame, or None when the window has nothing for that group
+	sent   = 0
+
+	for cid, client in list(clients.items()):
+		if not client['username'] or not client['ws'] or client['ws'].closed:
+			continue
+
+		group = audience_of(cid)
+
+		if group not in frames:
+			message       = batch.delta(group)
+			frames[group] = Frame(message) if message else None
+
+		if frames[group] is None:
+			continue
+
+		try:
+			await send_frame(client['ws'], frames[group], client.get('deflate', 0))
+			sent += 1
+		except:
+			pass
+
+	if recorder.enabled:
+		recorder.fanout('presence_delta', 'delta', sent)
+
 
 async def cleanup(client_id: str):
 	'''
@@ -678,27 +1259,179 @@ async def cleanup(client_id: str):
 	:param client_id: The ID of the client
 	'''
 
-	global session_start
-
 	if client_id not in clients:
 		return
 
+	if profiler.enabled:
+		with profiler.span('cleanup'):
+			return await _cleanup(client_id)
+
+	await _cleanup(client_id)
+
+
+async def _cleanup(client_id: str):
+	'''Removal and user_left fan-out behind cleanup()'''
+
+	global session_start
+
 	username = clients[client_id].get('username')
 	del clients[client_id]
 
+	if lobby.pop(client_id, None):
+		await update_lobby_positions()
+
+	if recorder.enabled:
+		recorder.disconnect(client_id)
+
 	active_users = len([c for c in clients.values() if c['username']])
 
 	if active_users == 0:
 		session_start = None
+		quality.clear()
 
 	logging.info(f'[{client_id}] Disconnected: {username} ({active_users} users)')
 
 	if username:
-		await broadcast_all({
+		occupancy_changed()
+
+		await publish_presence(client_id, {
 			'type' : 'user_left',
 			'id'   : client_id
 		})
 
+		await admit_waiting()
+
+
+def is_local_request(request: web.Request) -> bool:
+	'''
+	Check if a request came straight from the loopback interface (not forwarded by the reverse proxy)
+
+	:param request: The request object
+	'''
+
+	return request.remote in ('127.0.0.1', '::1') and 'X-Forwarded-For' not in request.headers
+
+
+async def profile_handler(request: web.Request) -> web.Response:
+	'''
+	Local-only profiling control
+
+	GET returns the current capture (?format=trace for Chrome trace-event JSON, ?format=collapsed
+	for flamegraph stacks, otherwise a status summary). POST ?action=start|stop toggles recording.
+
+	:param request: The request object
+	'''
+
+	if not is_local_request(request):
+		raise web.HTTPNotFound()
+
+	if request.method == 'POST':
+		action = request.query.get('action')
+		if action == 'start':
+			profiler.start()
+		elif action == 'stop':
+			profiler.stop()
+		else:
+			return web.json_response({'error': 'action must be start or stop'}, status=400)
+
+	fmt = request.query.get('format')
+
+	if fmt == 'trace':
+		return web.json_response(profiler.export_chrome_trace(), headers={'Content-Disposition': 'attachment; filename="hardchats.trace.json"'})
+	elif fmt == 'collapsed':
+		return web.Response(text=profiler.export_collapsed(), content_type='text/plain')
+
+	return web.json_response({'enabled': profiler.enabled, 'spans': len(profiler.spans)})
+
+
+async def quality_handler(request: web.Request) -> web.Response:
+	'''
+	Local-only sender -> receiver connection quality matrix built from client telemetry
+
+	:param request: The request object (optional ?window=<seconds>)
+	'''
+
+	if not is_local_request(request):
+		raise web.HTTPNotFound()
+
+	try:
+		window = float(request.query.get('window', config.TELEMETRY_WINDOW))
+	except ValueError:
+		return web.json_response({'error': 'window must be a number of seconds'}, status=400)
+
+	return web.json_response({
+		'window'  : window,
+		'samples' : quality.count,
+		'matrix'  : quality.matrix(time.time() - window)
+	})
+
+
+def toggle_profiling():
+	'''SIGUSR1 handler: start profiling, or stop it and write the capture to config.PROFILE_DIR'''
+
+	if not profiler.enabled:
+		profiler.start()
+		return
+
+	profiler.stop()
+
+	try:
+		trace, collapsed = profiler.dump(config.PROFILE_DIR)
+		logging.info(f'Profile written to {trace} and {collapsed}')
+	except OSError as e:
+		logging.error(f'Failed to write profile: {e}')
+
+
+def set_recording(enabled: bool):
+	'''
+	Start or stop the signaling recorder (disk errors are logged by the recorder, never raised)
+
+	:param enabled: Whether recording should be on
+	'''
+
+	recorder.start() if enabled else recorder.stop()
+
+
+async def on_startup(app: web.Application):
+	'''Register signal handlers and start the config watcher once the event loop is running'''
+
+	loop    = asyncio.get_running_loop()
+	reloads = app['config_reloads']
+
+	def reload_on_sighup():
+		# The loop only keeps weak references to tasks, so hold on to it until it finishes
+		task = loop.create_task(reload_config('SIGHUP'))
+		reloads.add(task)
+		task.add_done_callback(reloads.discard)
+
+	try:
+		loop.add_signal_handler(signal.SIGUSR1, toggle_profiling)
+		loop.add_signal_handler(signal.SIGUSR2, lambda: set_recording(not recorder.enabled))
+		loop.add_signal_handler(signal.SIGHUP, reload_on_sighup)
+	except (NotImplementedError, AttributeError):
+		pass # No SIGUSR1/SIGUSR2/SIGHUP on Windows
+
+	if config.RECORD_SIGNALING:
+		set_recording(True)
+
+	# Always running (it idles while CONFIG_WATCH_INTERVAL is 0) so a reload can switch it on
+	app['config_watcher'] = loop.create_task(watch_config())
+
+
+async def on_cleanup(app: web.Application):
+	'''Stop background tasks'''
+
+	if 'config_watcher' in app:
+		app['config_watcher'].cancel()
+
+	recorder.stop()
+
+	if occupancy_task:
+		occupancy_task.cancel()
+
+	if presence_timer:
+		presence_timer.cancel()
+
 
 @web.middleware
 async def no_cache_middleware(request: web.Request, handler):
@@ -717,6 +1450,11 @@ async def init_app():
 
 	# Create the application with no-cache middleware
 	app = web.Application(middlewares=[no_cache_middleware])
+	app.on_startup.append(on_startup)
+	app.on_cleanup.append(on_cleanup)
+	app['config_reloads'] = set() # in-flight SIGHUP reload tasks
+
+	build_config_response()
 
 	# Add routes
 	app.router.add_get('/', index)
@@ -724,7 +1462,10 @@ async def init_app():
 	app.router.add_get('/api/captcha', get_captcha)
 	app.router.add_get('/api/config', get_config)
 	app.router.add_get('/api/users/count', get_user_count)
+	app.router.add_get('/api/users/stream', occupancy_stream)
 	app.router.add_post('/api/leave', leave_handler)
+	app.router.add_route('*', '/api/debug/profile', profile_handler)
+	app.router.add_get('/api/debug/quality', quality_handler)
 	app.router.add_static('/static/', 'static')
 
 	return app
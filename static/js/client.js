@@ -5,7 +5,7 @@
 // Requires: notifications.js (showNotification, playSound, requestNotificationPermission)
 // Requires: settings.js (loadSettings, loadSavedUsername, saveUsername, loadSavedDevices)
 // Requires: ui.js (updateUI)
-// Requires: webrtc.js (createPeerConnection, handleOffer, handleAnswer, handleCandidate, setupLocalAudioAnalyser)
+// Requires: webrtc.js (createPeerConnection, handleOffer, handleAnswer, handleCandidate, setupLocalAudioAnalyser, dropPeerConnection)
 // Requires: media.js (toggleMic, toggleCam, toggleScreen, toggleVolume, toggleDefcon)
 // Requires: irc.js (initIrcListeners, toggleIrcSidebar, disconnectIrc)
 
@@ -115,14 +115,7 @@ document.addEventListener('DOMContentLoaded', async () => {
 	initSidebarResize();
 
 	loadCaptcha();
-	loadUserCount();
-
-	// Refresh user count every 10 seconds while on login screen
-	setInterval(() => {
-		if (!$('login-screen').classList.contains('hidden')) {
-			loadUserCount();
-		}
-	}, 10000);
+	watchUserCount();
 });
 
 // ========== CONFIG & LOGIN ==========
@@ -140,6 +133,7 @@ async function loadConfig() {
 
 		// Store max values
 		state.maxCameras = config.max_cameras;
+		state.telemetryInterval = config.telemetry_interval || 0;
 		state.configLoaded = true;
 
 		// Update footer with version and year
@@ -168,21 +162,47 @@ async function loadCaptcha() {
 	}
 }
 
+// The server pushes the room count over server-sent events whenever it changes.
+// EventSource reconnects on its own after network blips; if the feed is refused
+// outright (or unsupported) we fall back to polling, which the ETag keeps cheap.
+function watchUserCount() {
+	if (typeof EventSource === 'undefined') return pollUserCount();
+
+	const source = new EventSource('/api/users/stream');
+	source.onmessage = (e) => showUserCount(parseInt(e.data, 10) || 0);
+	source.onerror = () => {
+		if (source.readyState === EventSource.CLOSED) {
+			console.log('[Count] Occupancy feed refused, polling instead');
+			state.userCountSource = null;
+			pollUserCount();
+		}
+	};
+	state.userCountSource = source;
+}
+
+function stopWatchingUserCount() {
+	if (state.userCountSource) {
+		state.userCountSource.close();
+		state.userCountSource = null;
+	}
+}
+
+function pollUserCount() {
+	loadUserCount();
+
+	// Refresh user count every 10 seconds while on login screen
+	setInterval(() => {
+		if (!$('login-screen').classList.contains('hidden')) {
+			loadUserCount();
+		}
+	}, 10000);
+}
+
 async function loadUserCount() {
 	try {
 		const res = await fetch('/api/users/count');
 		const data = await res.json();
-		const count = data.count || 0;
-		const el = $('user-count-home');
-		if (el) {
-			if (count === 0) {
-				el.textContent = 'No one is yapping yet. Be the first!';
-			} else if (count === 1) {
-				el.textContent = '1 person is yapping';
-			} else {
-				el.textContent = `${count} people are yapping`;
-			}
-		}
+		showUserCount(data.count || 0);
 	} catch (e) {
 		console.error('User count error:', e);
 		const el = $('user-count-home');
@@ -190,6 +210,19 @@ async function loadUserCount() {
 	}
 }
 
+function showUserCount(count) {
+	const el = $('user-count-home');
+	if (el) {
+		if (count === 0) {
+			el.textContent = 'No one is yapping yet. Be the first!';
+		} else if (count === 1) {
+			el.textContent = '1 person is yapping';
+		} else {
+			el.textContent = `${count} people are yapping`;
+		}
+	}
+}
+
 function showError(msg) {
 	const el = $('login-error');
 	el.textContent = msg;
@@ -197,6 +230,13 @@ function showError(msg) {
 	loadCaptcha();
 }
 
+function showLobbyPosition(position, maxUsers) {
+	const el = $('login-error');
+	el.textContent = `Room is full (${maxUsers} max) - you are #${position} in line, you'll join automatically when a spot opens`;
+	el.classList.remove('hidden');
+	console.log(`[Lobby] Waiting for a slot, position ${position}`);
+}
+
 // ========== CONNECTION ==========
 
 async function connect() {
@@ -213,6 +253,9 @@ async function connect() {
 	state.username = username;
 	$('login-error').classList.add('hidden');
 
+	// A previous attempt may still be waiting in the lobby - give up that place first
+	if (state.ws && !state.myId) state.ws.close();
+
 	// Create the shared AudioContext and start the playback primer SYNCHRONOUSLY,
 	// before any await. Mobile browsers (Android Chrome, iOS Safari, Firefox Android)
 	// gate audio playback behind transient user activation that disappears after the
@@ -319,6 +362,12 @@ function handleSignal(data) {
 			showError(data.message);
 			break;
 
+		case 'lobby':
+			// Room is full and we passed the captcha: the server holds our place in line
+			// and pushes our position until a slot frees up, then sends 'users' as usual.
+			showLobbyPosition(data.position, data.max_users);
+			break;
+
 		case 'users':
 			// If reconnecting, clean up existing peers first
 			if (state.myId) {
@@ -356,6 +405,7 @@ function handleSignal(data) {
 
 			$('login-screen').classList.add('hidden');
 			$('chat-screen').classList.remove('hidden');
+			stopWatchingUserCount();
 
 			$('sidebar').classList.remove('hidden');
 			$('users-btn').classList.add('active');
@@ -378,7 +428,11 @@ function handleSignal(data) {
 					audioOnly: !!user.audio_only,
 					speaking: false
 				};
-				createPeerConnection(user.id, user.username, true);
+				// Server lists the peers in our audience group; everyone else (e.g. a
+				// breakout in progress) stays in the roster but never gets a connection.
+				if (!data.peers || data.peers.includes(user.id)) {
+					createPeerConnection(user.id, user.username, true);
+				}
 			});
 
 			updateUI();
@@ -411,47 +465,18 @@ function handleSignal(data) {
 			break;
 
 		case 'user_joined':
-			state.users[data.id] = {
-				username: data.username,
-				camOn: data.cam_on || false,
-				micOn: data.mic_on !== false,
-				screenOn: data.screen_on || false,
-				breakout: false,
-				speaking: false
-			};
+			addUser(data);
 			console.log('[Signal] user_joined:', data.id, 'micOn:', data.mic_on, 'state:', state.users[data.id]);
 			updateUI();
 
-			// Notification and sound. The server may roll a random join-sound easter egg
-			// (Seinfeld slice or NFL); otherwise the normal join sound plays.
 			showNotification('HardChats', `${data.username} joined the room`, 'user-join');
-			if (data.join_sound && data.join_sound.kind === 'clip') {
-				playSoundClip(data.join_sound.sound, data.join_sound.start, data.join_sound.duration);
-			} else if (data.join_sound && data.join_sound.kind === 'sound') {
-				playSound(data.join_sound.sound);
-			} else {
-				playSound('join');
-			}
+			playJoinSound(data.join_sound);
 			break;
 
 		case 'user_left':
 			const leftUsername = state.users[data.id]?.username || 'Someone';
 
-			// Immediately remove the user
-			if (state.peers[data.id]) {
-				teardownPeerAudio(data.id);
-				if (state.peers[data.id].connectionTimeout) clearTimeout(state.peers[data.id].connectionTimeout);
-				if (state.peers[data.id].statsInterval) clearInterval(state.peers[data.id].statsInterval);
-				try { state.peers[data.id].pc.close(); } catch (e) {}
-				delete state.peers[data.id];
-			}
-			delete state.users[data.id];
-			delete pendingCandidates[data.id];
-
-			if (state.maximizedPeer === data.id) {
-				state.maximizedPeer = null;
-			}
-
+			removeUser(data.id);
 			updateUI();
 
 			// Notification and sound
@@ -459,6 +484,10 @@ function handleSignal(data) {
 			playSound('leave');
 			break;
 
+		case 'presence_delta':
+			applyPresenceDelta(data);
+			break;
+
 		case 'offer':
 			state.users[data.from] = state.users[data.from] || { username: data.username, camOn: false, micOn: true, screenOn: false, speaking: false };
 			handleOffer(data.from, data.username, data.sdp);
@@ -608,6 +637,19 @@ function handleSignal(data) {
 			handleBreakoutStatus(data.id, !!data.breakout);
 			break;
 
+		case 'topology':
+			applyTopology(data);
+			break;
+
+		case 'config_update':
+			// Server config was hot-reloaded. Adopt the new limits right away, then
+			// refetch the full config (TURN/IRC may have changed too - ETag makes an
+			// unchanged refetch a 304).
+			state.maxCameras = data.max_cameras;
+			loadConfig();
+			updateUI();
+			break;
+
 		case 'nick_status':
 			// Per-user rainbow nick toggle. Server tells us when ANY user (including
 			// us) flips theirs - we just mirror it into local state and re-render.
@@ -622,6 +664,100 @@ function handleSignal(data) {
 	}
 }
 
+// ========== PRESENCE ==========
+
+function addUser(data) {
+	state.users[data.id] = {
+		username: data.username,
+		camOn: data.cam_on || false,
+		micOn: data.mic_on !== false,
+		screenOn: data.screen_on || false,
+		breakout: false,
+		speaking: false
+	};
+}
+
+// Immediately remove a user and any peer connection we have with them
+function removeUser(id) {
+	if (state.peers[id]) {
+		teardownPeerAudio(id);
+		if (state.peers[id].connectionTimeout) clearTimeout(state.peers[id].connectionTimeout);
+		if (state.peers[id].statsInterval) clearInterval(state.peers[id].statsInterval);
+		try { state.peers[id].pc.close(); } catch (e) {}
+		delete state.peers[id];
+	}
+	delete state.users[id];
+	delete pendingCandidates[id];
+
+	if (state.maximizedPeer === id) {
+		state.maximizedPeer = null;
+	}
+}
+
+// The server may roll a random join-sound easter egg (Seinfeld slice or NFL);
+// otherwise the normal join sound plays.
+function playJoinSound(joinSound) {
+	if (joinSound && joinSound.kind === 'clip') {
+		playSoundClip(joinSound.sound, joinSound.start, joinSound.duration);
+	} else if (joinSound && joinSound.kind === 'sound') {
+		playSound(joinSound.sound);
+	} else {
+		playSound('join');
+	}
+}
+
+// Server-side presence coalescing: every join, leave & status flip from one short
+// window arrives as a single frame, so a reconnect storm costs one re-render and
+// one sound instead of one per user. 'gone' are users who joined and left inside
+// the window - never announced, we only drop peer state their offer may have made.
+// Someone who left and came straight back (new id, same name) isn't announced either.
+function applyPresenceDelta(data) {
+	// The frame is shared by the whole room: if we joined inside this window, everyone up
+	// to and including us was already in our 'users' list.
+	const joined = data.joined.slice(data.joined.findIndex(u => u.id === state.myId) + 1);
+
+	const leftNames = data.left.map(id => state.users[id]?.username).filter(Boolean);
+	const returning = new Set(joined.map(u => u.username).filter(name => leftNames.includes(name)));
+	const arrivals = joined.filter(u => !returning.has(u.username));
+	const departures = leftNames.filter(name => !returning.has(name));
+
+	data.gone.forEach(removeUser);
+	data.left.forEach(removeUser);
+	joined.forEach(addUser);
+
+	Object.entries(data.status).forEach(([id, status]) => {
+		const user = id === state.myId ? state.users['local'] : state.users[id];
+		if (!user) return;
+		if ('cam_on' in status) user.camOn = status.cam_on;
+		if ('mic_on' in status) user.micOn = status.mic_on;
+		if ('screen_on' in status) user.screenOn = status.screen_on;
+		if (state.peers[id]) {
+			if ('cam_on' in status) state.peers[id].camOn = status.cam_on;
+			if ('screen_on' in status) state.peers[id].screenOn = status.screen_on;
+		}
+		if (status.cam_on === false && state.maximizedPeer === id) state.maximizedPeer = null;
+		if ('audio_only' in status && id !== state.myId) {
+			user.audioOnly = !!status.audio_only;
+			applyAudioOnlyGatingForPeer(id);
+		}
+	});
+
+	updateUI();
+
+	if (arrivals.length === 1) {
+		showNotification('HardChats', `${arrivals[0].username} joined the room`, 'user-join');
+		playJoinSound(arrivals[0].join_sound);
+	} else if (arrivals.length > 1) {
+		showNotification('HardChats', `${arrivals.length} users joined the room`, 'user-join');
+		playJoinSound(arrivals.find(u => u.join_sound)?.join_sound);
+	}
+
+	if (departures.length) {
+		showNotification('HardChats', departures.length === 1 ? `${departures[0]} left the room` : `${departures.length} users left the room`, 'user-leave');
+		if (!arrivals.length) playSound('leave');
+	}
+}
+
 // ========== BREAKOUT ROOM (*87#) ==========
 //
 // Per-user flag gates audio in both directions: if your breakout matches a peer's,
@@ -651,6 +787,41 @@ function handleBreakoutStatus(userId, inBreakout) {
 	updateUI();
 }
 
+// Server-side audience groups (main lobby vs breakout). The server only relays signaling
+// and media status between peers in the same group, and sends topology hints when
+// someone moves: 'drop' (close these peers), 'add' (media state of a peer joining our
+// group - they'll send the offer), or 'peers' (we moved: connect to exactly these).
+function inMyAudience(peerId) {
+	return !!state.users[peerId]?.breakout === !!state.users['local']?.breakout;
+}
+
+function applyTopology(data) {
+	(data.drop || []).forEach(id => {
+		if (id !== state.myId) dropPeerConnection(id);
+	});
+
+	[...(data.add || []), ...(data.users || [])].forEach(u => {
+		if (!state.users[u.id]) return;
+		state.users[u.id].camOn = !!u.cam_on;
+		state.users[u.id].micOn = u.mic_on !== false;
+		state.users[u.id].screenOn = !!u.screen_on;
+		state.users[u.id].audioOnly = !!u.audio_only;
+	});
+
+	if (data.peers) {
+		Object.keys(state.peers).forEach(id => {
+			if (!data.peers.includes(id)) dropPeerConnection(id);
+		});
+		data.peers.forEach(id => {
+			if (!state.peers[id] && state.users[id]) {
+				createPeerConnection(id, state.users[id].username, true);
+			}
+		});
+	}
+
+	updateUI();
+}
+
 // Recomputes per-peer audio gating against the local breakout flag.
 function applyBreakoutGatingAll() {
 	Object.keys(state.peers).forEach(applyBreakoutGatingForPeer);
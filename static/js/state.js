@@ -36,6 +36,13 @@ const state = {
 	sessionStart: null,
 	maxCameras: 10,
 	configLoaded: false,
+	// EventSource for the login screen's live user count (null once joined or polling)
+	userCountSource: null,
+	// Connection-quality telemetry (see queueTelemetry in webrtc.js). Interval comes
+	// from /api/config; 0 disables it.
+	telemetryInterval: 0,
+	telemetryTimer: null,
+	telemetry: {},
 	defconMode: false, // Auto-mute and hide video for new users
 	trippyMode: false, // UI hue-shift animation - toggled via server-side dial codes
 	schizoMode: false, // Subtle UI shake/wiggle - toggled via *666#
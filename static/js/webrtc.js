@@ -163,6 +163,7 @@ function startNetworkMonitoring(peerId) {
 			let packetsReceived = 0;
 			let jitter = 0;
 			let roundTripTime = 0;
+			let outgoingBitrate = null;
 			let hasAudioStats = false;
 
 			stats.forEach(report => {
@@ -177,6 +178,7 @@ function startNetworkMonitoring(peerId) {
 				// Look for candidate-pair stats for RTT
 				if (report.type === 'candidate-pair' && report.state === 'succeeded') {
 					roundTripTime = report.currentRoundTripTime || 0;
+					if (report.availableOutgoingBitrate !== undefined) outgoingBitrate = report.availableOutgoingBitrate;
 				}
 			});
 
@@ -213,6 +215,19 @@ function startNetworkMonitoring(peerId) {
 			peer.jitter = (jitter * 1000).toFixed(0);
 			peer.rtt = (roundTripTime * 1000).toFixed(0);
 
+			// Telemetry uses loss over the last poll only (the counters above are lifetime
+			// totals). Latest sample per peer wins until the next batch is sent.
+			const prev = peer.prevStats;
+			const deltaLost = prev ? packetsLost - prev.packetsLost : packetsLost;
+			const deltaTotal = prev ? totalPackets - prev.totalPackets : totalPackets;
+			peer.prevStats = { packetsLost, totalPackets };
+			queueTelemetry(peerId, [
+				Math.round(roundTripTime * 1000),
+				Math.round(jitter * 1000),
+				deltaTotal > 0 ? +(Math.max(deltaLost, 0) / deltaTotal * 100).toFixed(2) : 0,
+				outgoingBitrate === null ? null : Math.round(outgoingBitrate / 1000)
+			]);
+
 			updateUsersList();
 
 		} catch (e) {
@@ -221,6 +236,25 @@ function startNetworkMonitoring(peerId) {
 	}, 3000); // Check every 3 seconds
 }
 
+// Connection-quality telemetry. Each stats poll above records the latest
+// [rtt_ms, jitter_ms, loss_pct, available_outgoing_kbps] for its peer; a single timer
+// ships them to the server as one compact batch every state.telemetryInterval ms.
+function queueTelemetry(peerId, sample) {
+	if (!state.telemetryInterval) return;
+	state.telemetry[peerId] = sample;
+	if (!state.telemetryTimer) {
+		state.telemetryTimer = setInterval(flushTelemetry, state.telemetryInterval);
+	}
+}
+
+function flushTelemetry() {
+	const samples = Object.entries(state.telemetry)
+		.filter(([peerId]) => state.peers[peerId])
+		.map(([peerId, sample]) => [peerId, ...sample]);
+	state.telemetry = {};
+	if (samples.length > 0) send({ type: 'telemetry', samples });
+}
+
 async function createPeerConnection(peerId, username, initiator) {
 	if (state.peers[peerId]) {
 		teardownPeerAudio(peerId);
@@ -487,8 +521,10 @@ async function attemptIceRestart(peerId, pc) {
 
 	// Rebuild after a brief delay. If both sides hit this simultaneously they'll both
 	// initiate; perfect-negotiation in handleOffer resolves the resulting collision.
+	// Skip peers that moved to another audience group in the meantime.
 	setTimeout(() => {
 		if (state.users[peerId] && !state.peers[peerId] &&
+			(typeof inMyAudience !== 'function' || inMyAudience(peerId)) &&
 			state.ws?.readyState === WebSocket.OPEN && username) {
 			console.log(`[WebRTC] Rebuilding peer connection with ${peerId}`);
 			createPeerConnection(peerId, username, true);
@@ -500,6 +536,10 @@ async function renegotiatePeer(peerId, username) {
 	// Tear down old connection and create a fresh one
 	if (!state.users[peerId]) return;
 	if (!state.ws || state.ws.readyState !== WebSocket.OPEN) return;
+	if (typeof inMyAudience === 'function' && !inMyAudience(peerId)) {
+		dropPeerConnection(peerId);
+		return;
+	}
 
 	console.log(`[WebRTC] Renegotiating connection with ${peerId}`);
 
@@ -517,6 +557,22 @@ async function renegotiatePeer(peerId, username) {
 	await createPeerConnection(peerId, username, true);
 }
 
+// Close a peer connection but keep the user in the roster (used when the server moves
+// them into a different audience group than ours).
+function dropPeerConnection(peerId) {
+	const peer = state.peers[peerId];
+	if (!peer) return;
+
+	console.log(`[WebRTC] Dropping connection with ${peerId} (different audience group)`);
+	teardownPeerAudio(peerId);
+	if (peer.connectionTimeout) clearTimeout(peer.connectionTimeout);
+	if (peer.statsInterval) clearInterval(peer.statsInterval);
+	try { peer.pc.close(); } catch (e) {}
+	delete state.peers[peerId];
+	delete pendingCandidates[peerId];
+	if (state.maximizedPeer === peerId) state.maximizedPeer = null;
+}
+
 async function handleOffer(peerId, username, sdp) {
 	let pc;
 	let peer = state.peers[peerId];
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# HARDCHATS WebRTC Voice/Video Server - Developed by acidvegas (https://github.com/acidvegas/hardchats)
+# hardchats/telemetry.py
+
+import math
+from array import array
+
+
+class QualityRing:
+	'''
+	Fixed-size ring buffer of connection-quality samples for one room.
+
+	Each sample is one client's view of one peer: (time, reporter, peer, rtt, jitter, loss,
+	outgoing bitrate). Columns are preallocated typed arrays so memory stays flat no matter
+	how chatty clients are; the oldest samples are overwritten once the buffer is full.
+	Usernames are interned to small ints since client IDs change on every reconnect.
+	'''
+
+	def __init__(self, size: int):
+		self.size     = size
+		self.ts       = array('d', bytes(8 * size))
+		self.reporter = array('i', bytes(4 * size))
+		self.peer     = array('i', bytes(4 * size))
+		self.rtt      = array('f', bytes(4 * size)) # milliseconds
+		self.jitter   = array('f', bytes(4 * size)) # milliseconds
+		self.loss     = array('f', bytes(4 * size)) # percent of packets from peer -> reporter
+		self.bitrate  = array('f', bytes(4 * size)) # kbps available reporter -> peer
+		self.head     = 0
+		self.count    = 0
+		self.names    = [] # interned index -> username
+		self.index    = {} # username -> interned index
+
+
+	def clear(self):
+		'''Forget every sample (called when the room empties)'''
+
+		self.head  = 0
+		self.count = 0
+		self.names.clear()
+		self.index.clear()
+
+
+	def intern(self, name: str) -> int:
+		'''
+		Map a username to its interned index
+
+		:param name: The username
+		'''
+
+		if name not in self.index:
+			self.index[name] = len(self.names)
+			self.names.append(name)
+
+		return self.index[name]
+
+
+	def add(self, ts: float, reporter: str, peer: str, rtt: float, jitter: float, loss: float, bitrate: float):
+		'''
+		Append a sample, overwriting the oldest when full. Unknown metrics are passed as NaN.
+
+		:param ts: The time the sample was received
+		:param reporter: The username that measured it
+		:param peer: The username it was measured against
+		:param rtt: Round-trip time in milliseconds
+		:param jitter: Inbound audio jitter in milliseconds
+		:param loss: Inbound packet loss in percent
+		:param bitrate: Available outgoing bitrate in kbps
+		'''
+
+		i = self.head
+
+		self.ts[i]       = ts
+		self.reporter[i] = self.intern(reporter)
+		self.peer[i]     = self.intern(peer)
+		self.rtt[i]      = rtt
+		self.jitter[i]   = jitter
+		self.loss[i]     = loss
+		self.bitrate[i]  = bitrate
+
+		self.head  = (i + 1) % self.size
+		self.count = min(self.count + 1, self.size)
+
+
+	def matrix(self, since: float) -> dict:
+		'''
+		Build the sender -> receiver quality matrix from samples newer than `since`.
+
+		Loss & jitter are measured on the receiving side, so a report from R about P lands
+		in the P -> R cell. Available outgoing bitrate is the reporter's own uplink estimate,
+		so it lands in R -> P. RTT is symmetric and counts toward both.
+
+		:param since: Only use samples received after this time
+		'''
+
+		cells = {}
+
+		def cell(sender: int, receiver: int) -> dict:
+			key = (sender, receiver)
+			if key not in cells:
+				cells[key] = {'samples': 0, 'rtt': [0.0, 0], 'jitter': [0.0, 0], 'loss': [0.0, 0], 'bitrate': [0.0, 0]}
+			return cells[key]
+
+		def accumulate(target: dict, metric: str, value: float):
+			if not math.isnan(value):
+				target[metric][0] += value
+				target[metric][1] += 1
+
+		for n in range(self.count):
+			i = (self.head - 1 - n) % self.size
+			if self.ts[i] < since:
+				break # newest first, so everything after this is older
+
+			r, p = self.reporter[i], self.peer[i]
+
+			inbound  = cell(p, r)
+			outbound = cell(r, p)
+
+			inbound['samples'] += 1
+			accumulate(inbound,  'rtt',     self.rtt[i])
+			accumulate(inbound,  'jitter',  self.jitter[i])
+			accumulate(inbound,  'loss',    self.loss[i])
+			accumulate(outbound, 'rtt',     self.rtt[i])
+			accumulate(outbound, 'bitrate', self.bitrate[i])
+
+		result = {}
+
+		for (sender, receiver), c in cells.items():
+			row = result.setdefault(self.names[sender], {})
+			row[self.names[receiver]] = {
+				'rtt_ms'       : round(c['rtt'][0] / c['rtt'][1], 1)         if c['rtt'][1]     else None,
+				'jitter_ms'    : round(c['jitter'][0] / c['jitter'][1], 1)   if c['jitter'][1]  else None,
+				'loss_pct'     : round(c['loss'][0] / c['loss'][1], 2)       if c['loss'][1]    else None,
+				'bitrate_kbps' : round(c['bitrate'][0] / c['bitrate'][1])    if c['bitrate'][1] else None,
+				'samples'      : c['samples']
+			}
+
+		return result
+
+
+# Largest metric accepted from a client. Anything bigger is nonsense for ms/%/kbps and would
+# overflow the 32-bit float columns to inf (which /api/debug/quality can't serialize).
+METRIC_MAX = 1e6
+
+
+def parse_metric(value) -> float:
+	'''
+	Coerce a client-supplied metric to a float in 0..METRIC_MAX, or NaN if missing/bogus
+
+	:param value: The raw value from the telemetry message
+	'''
+
+	try:
+		value = float(value)
+	except (TypeError, ValueError):
+		return math.nan
+
+	return value if 0 <= value <= METRIC_MAX else math.nan